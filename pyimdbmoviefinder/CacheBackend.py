@@ -0,0 +1,472 @@
+'''
+Module providing a common cache interface with three backends:
+- MemoryCache: in-process LRU
+- SQLiteCache: SQLite file, shareable between the worker processes of a node
+- RedisCache: minimal client for servers speaking the Redis protocol (RESP)
+Values must be JSON serializable, so all backends behave the same.
+'''
+from typing import Any
+from abc import abstractmethod
+from collections import OrderedDict
+from dataclasses import dataclass
+import configparser
+import json
+import logging
+import socket
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger('pyimdbmoviefinder')
+DEFAULT_MAX_ENTRIES = 10000
+CONFIG_SECTION = 'Cache'
+DEFAULT_FAILURE_COOLDOWN = 30
+
+
+class CacheError(Exception):
+    """Raised when a cache backend can not be reached
+    """
+
+
+class CacheUnavailableError(CacheError):
+    """Raised while a cache backend is skipped after a connection failure
+    """
+
+
+CACHE_ERRORS = (CacheError, sqlite3.Error, ValueError, TypeError)
+
+
+@dataclass
+class CacheStats():
+    """Dataclass holding the statistics of a cache
+    """
+    hits: int = 0
+    misses: int = 0
+    sets: int = 0
+    errors: int = 0
+
+    @property
+    def hitRate(self) -> float:
+        """Ratio of lookups served from the cache
+
+        Returns:
+            float: The hit rate, 0 if nothing was looked up
+        """
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class CacheBackend:
+    """Base class of cache backends, counting hits and misses
+    """
+
+    def __init__(self):
+        """Constructor
+        """
+        self.stats = CacheStats()
+        self.statsLock = threading.Lock()
+
+    def get(self, key: str, default: Any = None) -> Any:
+        """Get a cached value. Backend failures are logged and counted as misses, so an
+        unavailable cache never breaks a search.
+
+        Args:
+            key (str): Cache key
+            default (Any, optional): Value returned on miss. Defaults to None.
+
+        Returns:
+            Any: The cached value, default if missing or expired
+        """
+        try:
+            found, value = self._get(key)
+        except CACHE_ERRORS as e:
+            logger.log(logging.DEBUG if isinstance(e, CacheUnavailableError) else logging.WARNING,
+                       "Cache lookup of %s failed: %s", key, e)
+            found, value = False, None
+            with self.statsLock:
+                self.stats.errors += 1
+        with self.statsLock:
+            if found:
+                self.stats.hits += 1
+            else:
+                self.stats.misses += 1
+        return value if found else default
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        """Store a value. Backend failures are logged and ignored.
+
+        Args:
+            key (str): Cache key
+            value (Any): JSON serializable value
+            ttl (float, optional): Time to live in seconds. Defaults to None (no expiry).
+        """
+        try:
+            self._set(key, value, ttl)
+        except CACHE_ERRORS as e:
+            logger.log(logging.DEBUG if isinstance(e, CacheUnavailableError) else logging.WARNING,
+                       "Cache store of %s failed: %s", key, e)
+            with self.statsLock:
+                self.stats.errors += 1
+            return
+        with self.statsLock:
+            self.stats.sets += 1
+
+    @abstractmethod
+    def _get(self, key: str):
+        """Return (found, value)"""
+
+    @abstractmethod
+    def _set(self, key: str, value: Any, ttl: float):
+        """Store a value"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove a value
+
+        Args:
+            key (str): Cache key
+        """
+
+    @abstractmethod
+    def ttl(self, key: str):
+        """Get the remaining time to live of a value
+
+        Args:
+            key (str): Cache key
+
+        Returns:
+            float | None: Seconds left, None if the key is missing or never expires
+        """
+
+    @abstractmethod
+    def size(self) -> int:
+        """Number of values stored
+
+        Returns:
+            int: The number of values
+        """
+
+    @abstractmethod
+    def clear(self):
+        """Remove all values
+        """
+
+
+class MemoryCache(CacheBackend):
+    """In-process LRU cache
+    """
+
+    def __init__(self, maxEntries: int = DEFAULT_MAX_ENTRIES):
+        """Constructor
+
+        Args:
+            maxEntries (int, optional): Max number of values. Defaults to 10000.
+        """
+        super().__init__()
+        self.maxEntries = maxEntries
+        # key -> (expiry or None, value)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return False, None
+            if entry[0] is not None and entry[0] <= time.monotonic():
+                del self.entries[key]
+                return False, None
+            self.entries.move_to_end(key)
+            return True, entry[1]
+
+    def _set(self, key, value, ttl):
+        expiry = time.monotonic() + ttl if ttl is not None else None
+        with self.lock:
+            self.entries[key] = (expiry, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxEntries:
+                self.entries.popitem(last=False)
+
+    def delete(self, key):
+        with self.lock:
+            self.entries.pop(key, None)
+
+    def ttl(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+        if entry is None or entry[0] is None:
+            return None
+        return max(0.0, entry[0] - time.monotonic())
+
+    def size(self):
+        with self.lock:
+            return len(self.entries)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+class SQLiteCache(CacheBackend):
+    """Cache stored in a SQLite file, evicting least recently used values over maxEntries.
+    Several processes can share the same file.
+    """
+
+    def __init__(self, path: str, maxEntries: int = DEFAULT_MAX_ENTRIES):
+        """Constructor
+
+        Args:
+            path (str): Database file path
+            maxEntries (int, optional): Max number of values. Defaults to 10000.
+        """
+        super().__init__()
+        self.path = path
+        self.maxEntries = maxEntries
+        self.local = threading.local()
+        with self.connection() as db:
+            db.execute('CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, '
+                       'expires REAL, accessed REAL)')
+            db.execute('CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)')
+
+    def connection(self) -> sqlite3.Connection:
+        """Get the connection of the current thread
+
+        Returns:
+            sqlite3.Connection: The connection
+        """
+        db = getattr(self.local, 'db', None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=10)
+            db.execute('PRAGMA journal_mode=WAL')
+            self.local.db = db
+        return db
+
+    def _get(self, key):
+        now = time.time()
+        with self.connection() as db:
+            row = db.execute('SELECT value, expires FROM cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                return False, None
+            if row[1] is not None and row[1] <= now:
+                db.execute('DELETE FROM cache WHERE key = ?', (key,))
+                return False, None
+            db.execute('UPDATE cache SET accessed = ? WHERE key = ?', (now, key))
+        return True, json.loads(row[0])
+
+    def _set(self, key, value, ttl):
+        now = time.time()
+        with self.connection() as db:
+            db.execute('INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?)',
+                       (key, json.dumps(value), now + ttl if ttl is not None else None, now))
+            overflow = db.execute('SELECT COUNT(*) FROM cache').fetchone()[0] - self.maxEntries
+            if overflow > 0:
+                db.execute('DELETE FROM cache WHERE key IN (SELECT key FROM cache '
+                           'ORDER BY accessed LIMIT ?)', (overflow,))
+
+    def delete(self, key):
+        with self.connection() as db:
+            db.execute('DELETE FROM cache WHERE key = ?', (key,))
+
+    def ttl(self, key):
+        row = self.connection().execute('SELECT expires FROM cache WHERE key = ?',
+                                        (key,)).fetchone()
+        if row is None or row[0] is None:
+            return None
+        return max(0.0, row[0] - time.time())
+
+    def size(self):
+        return self.connection().execute('SELECT COUNT(*) FROM cache').fetchone()[0]
+
+    def clear(self):
+        with self.connection() as db:
+            db.execute('DELETE FROM cache')
+
+
+class RedisCache(CacheBackend):
+    """Cache stored in a server speaking the Redis protocol. Keys are prefixed so several
+    applications can share a server; the size bound is left to the server maxmemory policy.
+    """
+
+    def __init__(self, host: str = 'localhost', port: int = 6379, prefix: str = 'pymf:',
+                 timeout: float = 5, failureCooldown: float = DEFAULT_FAILURE_COOLDOWN):
+        #pylint: disable=too-many-arguments
+        """Constructor
+
+        Args:
+            host (str, optional): Server host. Defaults to 'localhost'.
+            port (int, optional): Server port. Defaults to 6379.
+            prefix (str, optional): Prefix of all keys. Defaults to 'pymf:'.
+            timeout (float, optional): Socket timeout in seconds. Defaults to 5.
+            failureCooldown (float, optional): Seconds the server is not contacted after a
+                connection failure. Defaults to 30.
+        """
+        super().__init__()
+        self.address = (host, port)
+        self.prefix = prefix
+        self.timeout = timeout
+        self.failureCooldown = failureCooldown
+        self.retryAt = 0.0
+        self.sock = None
+        self.reader = None
+        self.lock = threading.Lock()
+
+    def command(self, *args):
+        """Send a command and read its reply, reconnecting once if an established connection
+        dropped. After a connection failure, commands fail immediately until the cooldown
+        expires, so an unreachable server does not stall every lookup.
+
+        Args:
+            args: Command name and arguments
+
+        Raises:
+            CacheUnavailableError: If the server is in failure cooldown
+            CacheError: If the server is unreachable, replied an error or an invalid reply
+
+        Returns:
+            Any: The decoded reply
+        """
+        payload = [f'*{len(args)}\r\n'.encode()]
+        for arg in args:
+            data = arg if isinstance(arg, bytes) else str(arg).encode()
+            payload.append(b'$%d\r\n%s\r\n' % (len(data), data))
+        payload = b''.join(payload)
+        with self.lock:
+            wait = self.retryAt - time.monotonic()
+            if wait > 0:
+                raise CacheUnavailableError(f"Redis server skipped for {wait:.0f}s")
+            for attempt in range(2):
+                connected = self.sock is not None
+                try:
+                    if not connected:
+                        self.sock = socket.create_connection(self.address, self.timeout)
+                        self.reader = self.sock.makefile('rb')
+                    self.sock.sendall(payload)
+                    return self.read_reply()
+                except OSError as e:
+                    self.close()
+                    if attempt or not connected:
+                        self.retryAt = time.monotonic() + self.failureCooldown
+                        logger.warning("Redis server unreachable, skipped for %ds: %s",
+                                       self.failureCooldown, e)
+                        raise CacheError(f"Redis server unreachable: {e}") from e
+                except ValueError as e:
+                    # The connection is out of sync with the server replies
+                    self.close()
+                    raise CacheError(f"Invalid Redis reply: {e}") from e
+        return None
+
+    def read_reply(self):
+        """Read one RESP reply
+
+        Raises:
+            CacheError: If the server replied an error
+            ValueError: If the reply is invalid
+
+        Returns:
+            Any: The decoded reply
+        """
+        line = self.reader.readline()
+        if not line:
+            raise ConnectionResetError("Connection closed by server")
+        kind, data = line[:1], line[1:-2]
+        if kind == b'+':
+            return data.decode()
+        if kind == b'-':
+            raise CacheError(data.decode())
+        if kind == b':':
+            return int(data)
+        if kind == b'$':
+            length = int(data)
+            return None if length < 0 else self.reader.read(length + 2)[:-2]
+        if kind == b'*':
+            length = int(data)
+            return None if length < 0 else [self.read_reply() for _ in range(length)]
+        raise ValueError(f"unexpected reply {line!r}")
+
+    def close(self):
+        """Close the connection
+        """
+        if self.sock is not None:
+            try:
+                self.sock.close()
+            except OSError:
+                pass
+        self.sock = None
+        self.reader = None
+
+    def _get(self, key):
+        data = self.command('GET', self.prefix + key)
+        if data is None:
+            return False, None
+        return True, json.loads(data)
+
+    def _set(self, key, value, ttl):
+        args = ['SET', self.prefix + key, json.dumps(value)]
+        if ttl is not None:
+            args += ['PX', max(1, int(ttl * 1000))]
+        self.command(*args)
+
+    def delete(self, key):
+        self.command('DEL', self.prefix + key)
+
+    def ttl(self, key):
+        remaining = self.command('PTTL', self.prefix + key)
+        return remaining / 1000 if remaining >= 0 else None
+
+    def scan_keys(self):
+        """Iterate over the keys having this cache prefix
+
+        Yields:
+            bytes: The full keys
+        """
+        cursor = b'0'
+        while True:
+            cursor, keys = self.command('SCAN', cursor, 'MATCH', self.prefix + '*',
+                                        'COUNT', 1000)
+            yield from keys
+            if cursor == b'0':
+                return
+
+    def size(self):
+        return sum(1 for _ in self.scan_keys())
+
+    def clear(self):
+        keys = list(self.scan_keys())
+        for first in range(0, len(keys), 1000):
+            self.command('DEL', *keys[first:first + 1000])
+
+
+def cache_from_config(config: configparser.ConfigParser):
+    """Build the cache backend described in a config.ini, ie:
+    [Cache]
+    Backend = sqlite
+    Path = /tmp/pyimdbmoviefinder.db
+    MaxEntries = 10000
+
+    Backend is one of memory, sqlite or redis (using Host, Port and Prefix).
+
+    Args:
+        config (configparser.ConfigParser): The parsed config
+
+    Returns:
+        CacheBackend | None: The cache, None if disabled or invalid
+    """
+    if not config.has_section(CONFIG_SECTION):
+        return None
+    section = config[CONFIG_SECTION]
+    backend = section.get('Backend', '').strip().lower()
+    try:
+        maxEntries = section.getint('MaxEntries', DEFAULT_MAX_ENTRIES)
+        if backend == 'memory':
+            return MemoryCache(maxEntries)
+        if backend == 'sqlite':
+            return SQLiteCache(section.get('Path') or 'pyimdbmoviefinder.db', maxEntries)
+        if backend == 'redis':
+            return RedisCache(section.get('Host', 'localhost'), section.getint('Port', 6379),
+                              section.get('Prefix', 'pymf:'))
+    except (ValueError, sqlite3.Error) as e:
+        logger.error("Invalid cache configuration: %s", e)
+        return None
+    if backend:
+        logger.error("Unknown cache backend: %s", backend)
+    return None
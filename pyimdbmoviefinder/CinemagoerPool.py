@@ -0,0 +1,110 @@
+'''
+Module holding a pool of reusable Cinemagoer access objects.
+A Cinemagoer instance is not safe to share between threads, so each thread checks one out
+of the pool for the duration of a lookup and returns it afterwards.
+'''
+from contextlib import contextmanager
+import logging
+import queue
+import threading
+from imdb import Cinemagoer
+
+logger = logging.getLogger('pyimdbmoviefinder')
+DEFAULT_POOL_SIZE = 4
+
+
+class CinemagoerPool:
+    """Bounded pool of Cinemagoer instances with checkout/return semantics
+    """
+
+    def __init__(self, maxSize: int = DEFAULT_POOL_SIZE, factory=Cinemagoer):
+        """Constructor
+
+        Args:
+            maxSize (int, optional): Max number of Cinemagoer instances. Defaults to 4.
+            factory (callable, optional): Builds a new access object. Defaults to Cinemagoer.
+        """
+        if maxSize < 1:
+            raise ValueError("Pool size must be at least 1")
+        self.maxSize = maxSize
+        self.factory = factory
+        self.idle = queue.LifoQueue()
+        self.created = 0
+        self.lock = threading.Lock()
+
+    def acquire(self, timeout: float = None):
+        """Take an access object out of the pool, creating it if the pool is not full yet.
+        Blocks when all instances are checked out.
+
+        Args:
+            timeout (float, optional): Max time to wait in seconds. Defaults to None (forever).
+
+        Raises:
+            TimeoutError: If no instance became available in time
+
+        Returns:
+            Cinemagoer: The access object
+        """
+        try:
+            return self.idle.get_nowait()
+        except queue.Empty:
+            pass
+        with self.lock:
+            if self.created < self.maxSize:
+                self.created += 1
+                create = True
+            else:
+                create = False
+        if create:
+            logger.debug("Creating Cinemagoer instance %d/%d", self.created, self.maxSize)
+            try:
+                return self.factory()
+            except Exception:
+                with self.lock:
+                    self.created -= 1
+                raise
+        try:
+            return self.idle.get(timeout=timeout)
+        except queue.Empty as e:
+            raise TimeoutError("No Cinemagoer instance available") from e
+
+    def release(self, imdbApi):
+        """Give an access object back to the pool
+
+        Args:
+            imdbApi (Cinemagoer): The access object previously acquired
+        """
+        self.idle.put(imdbApi)
+
+    @contextmanager
+    def checkout(self, timeout: float = None):
+        """Context manager wrapping acquire/release
+
+        Args:
+            timeout (float, optional): Max time to wait in seconds. Defaults to None (forever).
+
+        Yields:
+            Cinemagoer: The access object
+        """
+        imdbApi = self.acquire(timeout)
+        try:
+            yield imdbApi
+        finally:
+            self.release(imdbApi)
+
+
+_SHARED_POOL = None
+_SHARED_POOL_LOCK = threading.Lock()
+
+
+def get_shared_pool() -> CinemagoerPool:
+    """Get the process wide pool, created on first use
+
+    Returns:
+        CinemagoerPool: The shared pool
+    """
+    global _SHARED_POOL #pylint: disable=global-statement
+    with _SHARED_POOL_LOCK:
+        if _SHARED_POOL is None:
+            _SHARED_POOL = CinemagoerPool()
+        return _SHARED_POOL
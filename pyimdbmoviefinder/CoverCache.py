@@ -0,0 +1,284 @@
+'''
+Module used to resolve, download and cache movie cover thumbnails.
+Covers are requested already resized from the IMDb image CDN, stored on disk under the
+SHA-256 of their content and evicted least recently used first once the cache grows over
+its size bound.
+The image CDN is not a torrent provider, so it gets its own entry in the shared rate limiter,
+loose enough for all download workers to run at once. It can still be tuned in config.ini:
+[RateLimit m.media-amazon.com]
+Rate = 50
+MaxInFlight = 16
+'''
+from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import http.client
+import json
+import logging
+import os
+import re
+import tempfile
+import threading
+from pyimdbmoviefinder.ImdbSearcher import ImdbSearcher
+from pyimdbmoviefinder.http_utils import fetch_url
+from pyimdbmoviefinder.RateLimiter import get_rate_limiter
+
+logger = logging.getLogger('pyimdbmoviefinder')
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_THUMBNAIL_WIDTH = 300
+INDEX_FILE = 'index.json'
+# IMDb (Amazon) image urls accept resizing parameters between "._V1_" and the extension
+IMDB_IMAGE_REGEX = re.compile(r'\._V1_[^/]*?(\.\w+)$')
+IMDB_IMAGE_HOST = 'm.media-amazon.com'
+# Rate, burst and max in flight requests of the image CDN
+IMDB_IMAGE_LIMITS = (50.0, 16, 16)
+
+if IMDB_IMAGE_HOST not in get_rate_limiter().overrides:
+    # Keep limits already loaded from config.ini
+    get_rate_limiter().configure_host(IMDB_IMAGE_HOST, *IMDB_IMAGE_LIMITS)
+
+
+def thumbnail_url(coverUrl: str, width: int = DEFAULT_THUMBNAIL_WIDTH) -> str:
+    """Turn a full-size IMDb cover url into the url of a resized thumbnail
+
+    Args:
+        coverUrl (str): The full-size cover url
+        width (int, optional): Thumbnail width in pixels. Defaults to 300.
+
+    Returns:
+        str: The thumbnail url, or the original url if it can not be resized
+    """
+    if not coverUrl or not IMDB_IMAGE_REGEX.search(coverUrl):
+        return coverUrl
+    return IMDB_IMAGE_REGEX.sub(rf'._V1_UX{width}_\1', coverUrl)
+
+
+class CoverCache:
+    """Content-addressed, size-bounded on-disk cache of cover thumbnails
+    """
+
+    def __init__(self, directory: str, maxBytes: int = DEFAULT_MAX_BYTES,
+                 thumbnailWidth: int = DEFAULT_THUMBNAIL_WIDTH, searcher: ImdbSearcher = None,
+                 maxWorkers: int = 8):
+        #pylint: disable=too-many-arguments
+        """Constructor
+
+        Args:
+            directory (str): Cache directory, created if needed
+            maxBytes (int, optional): Max total size of cached images. Defaults to 200 MiB.
+            thumbnailWidth (int, optional): Thumbnail width in pixels. Defaults to 300.
+            searcher (ImdbSearcher, optional): Searcher used to resolve cover urls.
+                Defaults to a new ImdbSearcher.
+            maxWorkers (int, optional): Max concurrent downloads. Defaults to 8.
+        """
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.thumbnailWidth = thumbnailWidth
+        self.searcher = searcher if searcher else ImdbSearcher()
+        self.maxWorkers = maxWorkers
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self.index: Dict[str, str] = self.load_index()
+
+    def load_index(self) -> Dict[str, str]:
+        """Load the url -> content digest index
+
+        Returns:
+            Dict[str, str]: The index, empty if missing or unreadable
+        """
+        try:
+            with open(os.path.join(self.directory, INDEX_FILE), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def save_index(self):
+        """Persist the url -> content digest index
+        """
+        path = os.path.join(self.directory, INDEX_FILE)
+        with self.lock:
+            data = json.dumps(self.index)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            f.write(data)
+        os.replace(path + '.tmp', path)
+
+    def blob_path(self, digest: str) -> str:
+        """Path of the blob holding a content digest
+
+        Args:
+            digest (str): SHA-256 hex digest of the image
+
+        Returns:
+            str: The blob path
+        """
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, coverUrl: str):
+        """Get the cached thumbnail path of a cover url, marking it as recently used
+
+        Args:
+            coverUrl (str): The full-size cover url
+
+        Returns:
+            str | None: The path of the cached thumbnail, None if not cached
+        """
+        with self.lock:
+            digest = self.index.get(coverUrl)
+        if digest is None:
+            return None
+        path = self.blob_path(digest)
+        try:
+            os.utime(path)
+        except OSError:
+            with self.lock:
+                self.index.pop(coverUrl, None)
+            return None
+        return path
+
+    def read(self, coverUrl: str):
+        """Read the cached thumbnail of a cover url
+
+        Args:
+            coverUrl (str): The full-size cover url
+
+        Returns:
+            bytes | None: The image, None if not cached
+        """
+        path = self.get(coverUrl)
+        if path is None:
+            return None
+        try:
+            with open(path, 'rb') as f:
+                return f.read()
+        except OSError:
+            return None
+
+    def fetch(self, coverUrl: str):
+        """Get the thumbnail of a cover url, downloading it on cache miss
+
+        Args:
+            coverUrl (str): The full-size cover url
+
+        Returns:
+            str | None: The path of the cached thumbnail, None if the download failed
+        """
+        path = self.get(coverUrl)
+        if path is not None:
+            return path
+        try:
+            res, content = fetch_url(thumbnail_url(coverUrl, self.thumbnailWidth))
+        except (OSError, http.client.HTTPException) as e:
+            # Read timeouts and broken responses are not wrapped in URLError
+            res, content = False, str(e)
+        if not res:
+            logger.warning("Cover download failed: %s", content)
+            return None
+        digest = hashlib.sha256(content).hexdigest()
+        path = self.blob_path(digest)
+        try:
+            if not os.path.exists(path):
+                self.write_blob(path, content)
+        except OSError as e:
+            logger.warning("Cover %s could not be stored: %s", coverUrl, e)
+            return None
+        with self.lock:
+            self.index[coverUrl] = digest
+        return path
+
+    def write_blob(self, path: str, content: bytes):
+        """Atomically write a blob. Each writer uses its own temporary file, as several urls
+        may have the same content.
+
+        Args:
+            path (str): The blob path
+            content (bytes): The image
+
+        Raises:
+            OSError: If the blob could not be written
+        """
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmpPath = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.replace(tmpPath, path)
+        except OSError:
+            try:
+                os.remove(tmpPath)
+            except OSError:
+                pass
+            raise
+
+    def resolve_cover_urls(self, imdbIds: List[str]) -> Dict[str, str]:
+        """Find the cover urls of several movies, querying IMDb in parallel only for the ones
+        the searcher does not know yet
+
+        Args:
+            imdbIds (List[str]): IMDb IDs
+
+        Returns:
+            Dict[str, str]: IMDb ID -> full-size cover url, for movies having a cover
+        """
+        urls = {}
+        missing = []
+        for imdbId in imdbIds:
+            mov = self.searcher.get_movie_from_id(imdbId)
+            if mov and mov.coverUrl:
+                urls[imdbId] = mov.coverUrl
+            elif not mov or not mov.fullySearched:
+                missing.append(imdbId)
+        for mov in self.searcher.search_by_ids(missing):
+            if mov.coverUrl:
+                urls[mov.imdbId] = mov.coverUrl
+        return urls
+
+    def fetch_covers(self, imdbIds: List[str]) -> Dict[str, str]:
+        """Resolve and download the cover thumbnails of several movies concurrently
+
+        Args:
+            imdbIds (List[str]): IMDb IDs
+
+        Returns:
+            Dict[str, str]: IMDb ID -> cached thumbnail path, for covers available
+        """
+        urls = self.resolve_cover_urls(imdbIds)
+        if not urls:
+            return {}
+        with ThreadPoolExecutor(max_workers=min(self.maxWorkers, len(urls))) as executor:
+            paths = dict(zip(urls, executor.map(self.fetch, urls.values())))
+        self.evict()
+        self.save_index()
+        return {imdbId: path for imdbId, path in paths.items() if path}
+
+    def evict(self):
+        """Remove least recently used thumbnails until the cache fits in maxBytes
+        """
+        blobs = []
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if root == self.directory or name.endswith('.tmp'):
+                    # Index file, or blob being written
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                blobs.append((stat.st_mtime, stat.st_size, name))
+        total = sum(size for _, size, _ in blobs)
+        if total <= self.maxBytes:
+            return
+        removed = set()
+        for _, size, digest in sorted(blobs):
+            if total <= self.maxBytes:
+                break
+            try:
+                os.remove(self.blob_path(digest))
+            except OSError:
+                continue
+            removed.add(digest)
+            total -= size
+        logger.debug("Evicted %d covers from cache", len(removed))
+        with self.lock:
+            self.index = {url: digest for url, digest in self.index.items()
+                          if digest not in removed}
@@ -3,11 +3,18 @@ Module used to search for IMDb objects matching a specific search.
 Found results are then stored as MovieData objects for further processing.
 '''
 from typing import List
-from dataclasses import dataclass
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
 import logging
-from imdb import Cinemagoer
+import threading
+from pyimdbmoviefinder.CacheBackend import CacheBackend
+from pyimdbmoviefinder.CinemagoerPool import CinemagoerPool, get_shared_pool
+from pyimdbmoviefinder.MemoryProfiler import profiled
+from pyimdbmoviefinder.Snapshot import KIND_MOVIES, SnapshotError, SnapshotReader, \
+    from_record, to_record, write_snapshot
 
 logger = logging.getLogger('pyimdbmoviefinder')
+DEFAULT_CACHE_TTL = 24 * 60 * 60
 
 
 @dataclass
@@ -22,6 +29,16 @@ class MovieData():
     plot: str = ""
     trailerUrl: str = ""
     fullySearched: bool = False
+    kind: str = ""
+
+    def is_tv(self) -> bool:
+        """Tell if the IMDb object is a TV show rather than a movie
+
+        Returns:
+            bool: True for TV series, mini series and episodes
+        """
+        kind = (self.kind or "").lower()
+        return kind.startswith("tv series") or kind.startswith("tv mini") or kind == "episode"
 
 
 class ImdbSearcher():
@@ -32,11 +49,25 @@ class ImdbSearcher():
     2) Make a search by ID for a specific movie with detailed informations
     '''
 
-    def __init__(self) -> None:
-        '''Constructor'''
-        self.imdbApi = Cinemagoer()
+    def __init__(self, pool: CinemagoerPool = None, cache: CacheBackend = None,
+                 cacheTtl: float = DEFAULT_CACHE_TTL) -> None:
+        """Constructor
+
+        Args:
+            pool (CinemagoerPool, optional): Pool of Cinemagoer instances. Defaults to the
+                process wide shared pool.
+            cache (CacheBackend, optional): Cache of movie details and cover urls, possibly
+                shared with other processes. Defaults to None (no cache).
+            cacheTtl (float, optional): Seconds cached IMDb data is kept. Defaults to 1 day.
+        """
+        self.pool = pool if pool else get_shared_pool()
+        self.cache = cache
+        self.cacheTtl = cacheTtl
         self.moviesList: List[MovieData] = []
+        self.lock = threading.Lock()
+        self.snapshot: SnapshotReader = None
 
+    @profiled("imdb.search_by_title")
     def search_by_title(self, title, maxResult=10, includeTv=False):
         """Search Movie on IMDb by title
 
@@ -46,53 +77,139 @@ class ImdbSearcher():
             includeTv (bool, optional): If TV shows results should be included. Defaults to False.
 
         Returns:
-            List: List of MovieData result
+            List: List of all MovieData found by this searcher, including previous searches.
+                None if this search found nothing. See iter_by_title() and search_page()
+                for the results of the current search only.
+        """
+        found = False
+        for _ in self.iter_by_title(title, maxResult, includeTv):
+            found = True
+        if not found:
+            return None
+        return self.moviesList
+
+    @profiled("imdb.search_page")
+    def search_page(self, title, offset=0, limit=10, includeTv=False):
+        """Get one page of the results of a title search
+
+        Args:
+            title (str): Title of wanted movie
+            offset (int, optional): Number of results to skip. Defaults to 0.
+            limit (int, optional): Max number of results. Defaults to 10.
+            includeTv (bool, optional): If TV shows results should be included. Defaults to False.
+
+        Returns:
+            List: List of MovieData of this page only
         """
+        return list(self.iter_by_title(title, limit, includeTv, offset))
+
+    def iter_by_title(self, title, maxResult=10, includeTv=False, offset=0):
+        """Search Movie on IMDb by title, converting results lazily
+
+        Args:
+            title (str): Title of wanted movie
+            maxResult (int, optional): Max number of results. Defaults to 10.
+            includeTv (bool, optional): If TV shows results should be included. Defaults to False.
+            offset (int, optional): Number of results to skip. Defaults to 0.
+
+        Yields:
+            MovieData: The results of this search, also stored in moviesList
+        """
+        maxResult = int(maxResult)
+        offset = int(offset)
         logger.info("Search movie by title: %s", title)
         logger.debug("Include TV : %s", includeTv)
         try:
             # TODO(fixme): search_movie_advanced() does not work anymore ?
-            movieResult = self.imdbApi.search_movie(title, results=maxResult)
+            with self.pool.checkout() as imdbApi:
+                movieResult = imdbApi.search_movie(title, results=offset + maxResult)
         except Exception: #pylint: disable=broad-exception-caught
             logger.warning("No results")
-            return None
+            return
         if movieResult is None:
             logger.warning("No results")
-            return None
+            return
+        count = 0
         for mov in movieResult:
-            coverUrl = None
-            if 'full-size cover url' in mov.keys():
-                coverUrl = mov['full-size cover url']
+            if count >= offset + maxResult:
+                return
             if not includeTv and ('kind' in mov.keys()) \
                     and mov['kind'].lower() != "movie":
                 logger.info("Skipped Serie %s", mov['title'])
                 # Skip series
                 continue
+            count += 1
+            if count <= offset:
+                continue
+            coverUrl = None
+            if 'full-size cover url' in mov.keys():
+                coverUrl = mov['full-size cover url']
             year = self.find_movie_info(mov, 'year')
             rating = self.find_movie_info(mov, 'rating')
+            kind = self.find_movie_info(mov, 'kind')
             mov = MovieData(
-                mov.getID(), mov['long imdb title'], year, coverUrl, rating)
-            self.moviesList.append(mov)
-        return self.moviesList
+                mov.getID(), mov['long imdb title'], year, coverUrl, rating, kind=kind or "")
+            with self.lock:
+                self.moviesList.append(mov)
+            yield mov
 
-    def search_by_id(self, imdbId):
+    @profiled("imdb.search_by_id")
+    def search_by_id(self, imdbId, refresh=False):
         """Start searching for a movie by IMDb ID
 
         Args:
             imdbId (str): The  IMDb ID of the movie
+            refresh (bool, optional): Query IMDb even if the movie was already fully searched
+                (ie. restored from a snapshot). Defaults to False.
 
         Returns:
             MovieData: A filled MovieData object containing result
         """
+        if not refresh:
+            # Under the lock so concurrent lookups decode a snapshot entry only once
+            with self.lock:
+                mov = self.get_movie_from_id(imdbId)
+            if mov and mov.fullySearched:
+                return mov
+            mov = self._load_cached_movie(imdbId)
+            if mov:
+                return mov
         logger.info("Search movie by ID: %s", imdbId)
-        movieResult = self.imdbApi.get_movie(imdbId)
-        mov = self.get_movie_from_id(imdbId)
+        with self.pool.checkout() as imdbApi:
+            movieResult = imdbApi.get_movie(imdbId)
         vids = self.find_movie_info(movieResult, 'videos')
         if vids:
             trailerUrl = "https://www.imdb.com/video/imdb/"+vids[0].rsplit('/', 1)[-1] \
                 + "/imdb/embed?autoplay=false&width=720"
-        if not mov:
+        with self.lock:
+            mov = self._store_movie(imdbId, movieResult, trailerUrl if vids else None)
+        if self.cache is not None:
+            self.cache.set(f"imdb:movie:{imdbId}", to_record(mov), self.cacheTtl)
+        return mov
 
+    def _load_cached_movie(self, imdbId):
+        if self.cache is None:
+            return None
+        values = self.cache.get(f"imdb:movie:{imdbId}")
+        if values is None:
+            return None
+        try:
+            cached = from_record(MovieData, values)
+        except SnapshotError as e:
+            logger.debug("Ignoring cached movie %s: %s", imdbId, e)
+            return None
+        with self.lock:
+            mov = self.get_movie_from_id(imdbId)
+            if not mov:
+                self.moviesList.append(cached)
+                return cached
+            for field in fields(MovieData):
+                setattr(mov, field.name, getattr(cached, field.name))
+            return mov
+
+    def _store_movie(self, imdbId, movieResult, trailerUrl):
+        mov = self.get_movie_from_id(imdbId)
+        if not mov:
             movieObj = MovieData(imdbId,
                                  self.find_movie_info(
                                      movieResult, 'long imdb title'),
@@ -103,8 +220,9 @@ class ImdbSearcher():
                                  movieResult.summary(),
                                  self.find_movie_info(
                                      movieResult, 'plot outline'),
-                                 trailerUrl if vids else None,
-                                 fullySearched=True)
+                                 trailerUrl,
+                                 fullySearched=True,
+                                 kind=self.find_movie_info(movieResult, 'kind') or "")
             self.moviesList.append(movieObj)
             return movieObj
 
@@ -113,8 +231,36 @@ class ImdbSearcher():
         mov.year = self.find_movie_info(movieResult, 'year')
         mov.summary = movieResult.summary()
         mov.plot = self.find_movie_info(movieResult.data, 'plot outline')
+        mov.trailerUrl = trailerUrl
         return mov
 
+    @profiled("imdb.search_by_ids")
+    def search_by_ids(self, imdbIds, maxWorkers: int = None):
+        """Search several movies by IMDb ID in parallel, using at most one thread per
+        instance available in the Cinemagoer pool
+
+        Args:
+            imdbIds (List[str]): The IMDb IDs of the movies
+            maxWorkers (int, optional): Max concurrent lookups. Defaults to the pool size.
+
+        Returns:
+            List: List of filled MovieData, in the same order as the IDs. IDs whose lookup
+                failed are left out.
+        """
+        imdbIds = list(imdbIds)
+        if not imdbIds:
+            return []
+        workers = min(maxWorkers or self.pool.maxSize, self.pool.maxSize, len(imdbIds))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(self.search_by_id, imdbId) for imdbId in imdbIds]
+        result = []
+        for imdbId, future in zip(imdbIds, futures):
+            try:
+                result.append(future.result())
+            except Exception as e: #pylint: disable=broad-exception-caught
+                logger.warning("Search by ID %s failed: %s", imdbId, e)
+        return result
+
     def get_cover_url(self, imdbId):
         """Find the movie cover url in the movie object
 
@@ -124,8 +270,17 @@ class ImdbSearcher():
         Returns:
             str: The URL of the Movie cover
         """
+        key = f"imdb:cover:{imdbId}"
+        if self.cache is not None:
+            coverUrl = self.cache.get(key)
+            if coverUrl is not None:
+                return coverUrl
         # getting cover url of the series
-        return self.imdbApi.get_movie(imdbId).data['full-size cover url']
+        with self.pool.checkout() as imdbApi:
+            coverUrl = imdbApi.get_movie(imdbId).data['full-size cover url']
+        if self.cache is not None:
+            self.cache.set(key, coverUrl, self.cacheTtl)
+        return coverUrl
 
     def get_summary(self, imdbId):
         """Get the summary of a IMDb object
@@ -136,7 +291,8 @@ class ImdbSearcher():
         Returns:
             str: The summare of the IMDb object
         """
-        return self.imdbApi.get_movie(imdbId).summary()
+        with self.pool.checkout() as imdbApi:
+            return imdbApi.get_movie(imdbId).summary()
 
     def get_movie_from_title(self, title: str):
         """Returns the MovieData corresponding to the given title
@@ -164,6 +320,16 @@ class ImdbSearcher():
         for mov in self.moviesList:
             if mov.imdbId == imdbId:
                 return mov
+        if self.snapshot is not None:
+            try:
+                values = self.snapshot.get(imdbId)
+                mov = from_record(MovieData, values) if values is not None else None
+            except SnapshotError as e:
+                logger.warning("Ignoring snapshot movie %s: %s", imdbId, e)
+                return None
+            if mov is not None:
+                self.moviesList.append(mov)
+                return mov
         return None
 
     def find_movie_info(self, movie: MovieData, key: str):
@@ -183,4 +349,49 @@ class ImdbSearcher():
         """Clear all found matching movies in this instance
         """
         logger.debug("Clear IMDb search results !")
-        self.moviesList = []
+        with self.lock:
+            self.moviesList = []
+            if self.snapshot is not None:
+                self.snapshot.close()
+                self.snapshot = None
+
+    def save_state(self, path: str) -> int:
+        """Save all found movies, including the ones not loaded yet from a previous snapshot,
+        to a snapshot file
+
+        Args:
+            path (str): Snapshot file path
+
+        Returns:
+            int: Number of movies saved
+        """
+        with self.lock:
+            movies = {mov.imdbId: to_record(mov) for mov in self.moviesList}
+            if self.snapshot is not None:
+                for imdbId in self.snapshot.keys():
+                    if imdbId not in movies:
+                        try:
+                            movies[imdbId] = self.snapshot.get(imdbId)
+                        except SnapshotError as e:
+                            logger.warning("Dropping snapshot movie %s: %s", imdbId, e)
+        return write_snapshot(path, KIND_MOVIES, movies.items())
+
+    def load_state(self, path: str) -> int:
+        """Restore movies from a snapshot file. Movies are decoded lazily when looked up by ID.
+
+        Args:
+            path (str): Snapshot file path
+
+        Raises:
+            SnapshotError: If the file is not a valid movies snapshot
+
+        Returns:
+            int: Number of movies available in the snapshot
+        """
+        snapshot = SnapshotReader(path, KIND_MOVIES)
+        with self.lock:
+            if self.snapshot is not None:
+                self.snapshot.close()
+            self.snapshot = snapshot
+        logger.info("Loaded %d movies from snapshot %s", len(snapshot), path)
+        return len(snapshot)
@@ -4,23 +4,172 @@ Results are then stored in TorrentResult object for further processing
 '''
 
 from typing import List
+from concurrent.futures import BrokenExecutor, ProcessPoolExecutor
+import functools
 import logging
+import multiprocessing
+import os
+import pickle
 import re
+import threading
 import xml.etree.ElementTree as ET
 import humanize
-from pyimdbmoviefinder.http_utils import build_url, fetch_url
-from pyimdbmoviefinder.TorrentFetcher import TorrentFetcher, TorrentResult
+from pyimdbmoviefinder.http_utils import build_url, fetch_url, fetch_url_conditional
+from pyimdbmoviefinder.MemoryProfiler import profiled
+from pyimdbmoviefinder.utils import LogSampler
+from pyimdbmoviefinder.TorrentFetcher import TorrentFetcher, TorrentResult, SearchQuery, \
+    FilterSpec, register_fetcher, find_release_type
 
 logger = logging.getLogger('pyimdbmoviefinder')
 DEFAULT_HOST = "http://localhost:9117"
+TORZNAB_ATTR = '{http://torznab.com/schemas/2015/feed}attr'
+UPLOADER_REGEX = re.compile(r'-1? *\w*')
+# Feeds with at least this many items are parsed in a process pool
+PARALLEL_THRESHOLD = 2000
+MAX_PARSE_WORKERS = 4
+ITEM_START_REGEX = re.compile(rb'<item[\s>]')
+ITEM_END = b'</item>'
+NAMESPACE_REGEX = re.compile(rb'xmlns(?::[\w.-]+)?="[^"]*"')
+ITEM_LOG_SAMPLER = LogSampler()
+_PARSE_POOL = None
+_PARSE_POOL_LOCK = threading.Lock()
+# Skip cam releases and torrents without seeders
+DEFAULT_FILTER = FilterSpec(minSeeders=1, excludedSources=('cam',))
 
 
+def find_xml_attribute(xmlElement, attr):
+    """
+    Finds a specific XML attribute given a element name
+    :param xml.etree.ElementTree.Element xmlElement: the xml tree we want to search
+    :param str attr: the attribute/element name we want to find in the xml tree
+    :return: the value of the element fiven the attr/element name
+    :rtype: str
+    """
+    value = xmlElement.find(attr)
+    if value is not None:
+        logger.debug('Found attribute: %s', attr)
+        return value.text
+    logger.warning('Could not find attribute: %s', attr)
+    return ''
+
+
+def extract_item(child, filterSpec: FilterSpec = DEFAULT_FILTER):
+    """
+    Extract the torrent fields of a feed item in a single pass. The filter is evaluated on
+    the raw fields, so rejected items skip the release type scan and size formatting.
+    :param xml.etree.ElementTree.Element child: the item element
+    :param FilterSpec filterSpec: the filter items must pass
+    :return: (title, quality, seeders, size, sizeBytes, provider, magnet, infoHash),
+        None for items rejected by the filter
+    :rtype: tuple
+    """
+    title = child.findtext('title') or ''
+    if not filterSpec.accepts_release(title):
+        ITEM_LOG_SAMPLER.log(logger, logging.DEBUG, 'release', "Release filtered: %s", title)
+        return None
+    attrs = {elm.get('name'): elm.get('value') for elm in child.iterfind(TORZNAB_ATTR)}
+    size = child.findtext('size') or ''
+    try:
+        sizeBytes = int(size)
+    except ValueError:
+        sizeBytes = 0
+    try:
+        seeders = int(attrs.get('seeders') or 0)
+    except ValueError:
+        seeders = 0
+    if not filterSpec.accepts_stats(seeders, sizeBytes):
+        ITEM_LOG_SAMPLER.log(logger, logging.DEBUG, 'stats',
+                             "Seeders/size filtered: %s", title)
+        return None
+    if sizeBytes:
+        size = humanize.naturalsize(sizeBytes)
+    quality = find_release_type(title, '?')
+    foundUploader = UPLOADER_REGEX.findall(title)
+    uploader = foundUploader[-1][1:] if foundUploader else ''
+    return (title, quality, seeders, size, sizeBytes,
+            f"{child.findtext('jackettindexer') or ''} - {uploader}",
+            child.findtext('link') or '', attrs.get('infohash') or '')
+
+
+def parse_items_chunk(chunkXml: bytes, filterSpec: FilterSpec = DEFAULT_FILTER):
+    """
+    Process pool worker extracting the torrent fields of a chunk of feed items
+    :param bytes chunkXml: the items wrapped in a single root element
+    :param FilterSpec filterSpec: the filter items must pass
+    :return: the extracted fields, as compact tuples, and the number of items filtered out
+    :rtype: list, int
+    """
+    root = ET.fromstring(chunkXml)
+    extracted = [extract_item(child, filterSpec) for child in root.iter('item')]
+    items = [fields for fields in extracted if fields is not None]
+    return items, len(extracted) - len(items)
+
+
+def get_parse_pool() -> ProcessPoolExecutor:
+    """
+    Get the process pool used to parse large feeds, created on first use. Workers are
+    started with forkserver (or spawn), as feeds are parsed from threads and forking a
+    threaded process may copy locks held by other threads.
+    :return: the process pool
+    :rtype: concurrent.futures.ProcessPoolExecutor
+    """
+    global _PARSE_POOL #pylint: disable=global-statement
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is None:
+            method = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() \
+                else 'spawn'
+            _PARSE_POOL = ProcessPoolExecutor(
+                max_workers=min(os.cpu_count() or 1, MAX_PARSE_WORKERS),
+                mp_context=multiprocessing.get_context(method))
+        return _PARSE_POOL
+
+
+def discard_parse_pool(pool: ProcessPoolExecutor):
+    """
+    Drop a broken parse pool, so the next large feed starts a new one
+    :param concurrent.futures.ProcessPoolExecutor pool: the broken pool
+    """
+    global _PARSE_POOL #pylint: disable=global-statement
+    with _PARSE_POOL_LOCK:
+        if _PARSE_POOL is pool:
+            _PARSE_POOL = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def split_feed_items(rawXml: bytes, chunkCount: int):
+    """
+    Split a raw feed in chunks of items without parsing it. Each chunk is wrapped in a root
+    element declaring the namespaces of the feed root element.
+    :param bytes rawXml: the xml page returned by querying jackett
+    :param int chunkCount: the number of chunks wanted
+    :return: the chunks
+    :rtype: list
+    """
+    starts = [match.start() for match in ITEM_START_REGEX.finditer(rawXml)]
+    if not starts:
+        return []
+    header = rawXml[:starts[0]]
+    namespaces = b' '.join(dict.fromkeys(NAMESPACE_REGEX.findall(header)))
+    chunkSize = -(-len(starts) // chunkCount)
+    chunks = []
+    for first in range(0, len(starts), chunkSize):
+        last = min(first + chunkSize, len(starts)) - 1
+        end = rawXml.index(ITEM_END, starts[last]) + len(ITEM_END)
+        chunks.append(b'<chunk ' + namespaces + b'>' + rawXml[starts[first]:end] + b'</chunk>')
+    return chunks
+
+
+@register_fetcher("Jackett", latency=5.0, cost=3.0, searchByImdbId=False, supportsTv=True)
 class JackettFetcher(TorrentFetcher):
     """docstring for JackettFetcher"""
 
     def __init__(self, imdbId, title, apiKey, host=DEFAULT_HOST, path="torznab/all", \
-        limit=25): #pylint: disable=too-many-arguments
-        '''Constructor'''
+        limit=25, parseWorkers=None, filterSpec=None): #pylint: disable=too-many-arguments
+        '''Constructor
+        parseWorkers: processes used to parse large feeds, None to decide from the feed size,
+            1 to always parse in the current process
+        filterSpec: filter applied to feed items, on top of the default one skipping cam
+            releases and torrents without seeders'''
         self.movieId = "tt"+imdbId
         self.title = title
         if not host:
@@ -29,30 +178,51 @@ class JackettFetcher(TorrentFetcher):
         logger.info('Host %s, API key %s', host, apiKey)
         ssl = host.startswith('https')
         self.api = Jackett(apiKey, host, path, limit, ssl)
+        self.api.parseWorkers = parseWorkers
+        self.api.filterSpec = DEFAULT_FILTER.combine(filterSpec)
+
+    @classmethod
+    def from_query(cls, query: SearchQuery):
+        """Build the fetcher for a search query
+
+        Args:
+            query (SearchQuery): The search query, with jackettApiKey and jackettHost options,
+                and optionally a filter spec
+
+        Raises:
+            ValueError: If the API key or host is missing
 
+        Returns:
+            JackettFetcher: The fetcher
+        """
+        apiKey = query.options.get('jackettApiKey')
+        host = query.options.get('jackettHost')
+        if not apiKey or not host:
+            raise ValueError("Set a valid API key/Host to use jackett indexers")
+        return cls(query.imdbId, query.title, apiKey, host, filterSpec=query.filterSpec)
+
+    @profiled("fetch.Jackett")
     def fetch(self) -> tuple[bool, List[TorrentResult]]:
         """Run the fetcher with provided arguments
 
         Returns:
             tuple[bool, List[TorrentResult]]: List of torrents found
         """
-        success, output = self.api.search(self.title)
+        success, output = self.api.search(self.title, self.validators)
+        if success and output is None and self.validators is not None:
+            # Feed did not change since previous fetch
+            self.unchanged = True
+            return True, None
         if success and not output:
+            if self.api.filteredCount:
+                # Torrents were found, none passed the filter
+                return True, []
             # Give up
-            return None, output
+            return None, "Torrents not found on Jackett"
         if not success:
             return success, output
-        torrents_final = []
-        for torrent in output:
-            #pylint: disable=no-member
-            if torrent.seeds is not None and torrent.seeds == 0:
-                logger.debug("No seeders, skipping...")
-                continue
-            logger.debug("Found torrent with seeders: %s", torrent.name)
-            torrents_final.append(torrent)
         # Sort by seeders
-        sorted_torrents = sorted(
-            torrents_final, key=lambda e: e.seeds, reverse=True)
+        sorted_torrents = sorted(output, key=lambda e: e.seeds, reverse=True)
         return True, sorted_torrents
 
 
@@ -66,6 +236,10 @@ class Jackett():
         self.path = path
         self.pageLimit = limit
         self.ssl = ssl
+        self.parseWorkers = None
+        self.filterSpec = DEFAULT_FILTER
+        # Number of items rejected by the filter in the last parsed feed
+        self.filteredCount = 0
 
     def get_apikey(self):
         """Get the configured Jackett API Key
@@ -93,11 +267,13 @@ class Jackett():
         logger.debug('Current page limit: %s pages', self.pageLimit)
         return self.pageLimit
 
-    def search(self, query) -> tuple[bool, List[TorrentResult]]:
+    def search(self, query, validators: dict = None) -> tuple[bool, List[TorrentResult]]:
         """
         Starts the call to getting result from our indexer
         :param str query: query we want to search for
-        :return: list of results we found from scraping jackett output based on query
+        :param dict validators: validators of the previous response for a conditional request
+        :return: list of results we found from scraping jackett output based on query,
+            None if the feed did not change since the previous request
         :rtype: bool, list
         """
         path = self.get_path().split('/')
@@ -110,7 +286,12 @@ class Jackett():
 
         url = build_url(self.ssl, self.host, path, url_args)
         url = url.replace('+', '%20')
-        res, output = fetch_url(url)
+        if validators is None:
+            res, output = fetch_url(url)
+        else:
+            res, output = fetch_url_conditional(url, validators)
+            if res and output is None:
+                return True, None
         if res:
             return True, self.parse_xml_for_torrents(output)
         return False, output
@@ -124,64 +305,48 @@ class Jackett():
         :return: the value of the element fiven the attr/element name
         :rtype: str
         """
-        value = xmlElement.find(attr)
-        if value is not None:
-            logger.debug('Found attribute: %s', attr)
-            return value.text
-        logger.warning('Could not find attribute: %s', attr)
-        return ''
-
-    def parse_xml_for_torrents(self, rawXml):
+        return find_xml_attribute(xmlElement, attr)
+
+    @profiled("parse.Jackett")
+    def parse_xml_for_torrents(self, rawXml, workers=None):
         """
         Finds a specific XML attribute given a element name
         :param jackett.Jackett self: object instance
         :param bytes rawXml: the xml page returned by querying jackett
-        :return: all the torrents we found in the xml page
+        :param int workers: processes used for parsing, defaults to parseWorkers, or to the cpu
+            count for feeds of at least PARALLEL_THRESHOLD items. Capped to MAX_PARSE_WORKERS.
+        :return: all the torrents we found in the xml page passing the filter
         :rtype: list
         """
-        tree = ET.fromstring(rawXml)
-        channel = tree.find('channel')
-        results = []
-
-        for child in channel.findall('item'):
-            title = self.find_xml_attribute(child, 'title')
-            date = self.find_xml_attribute(child, 'pubDate')
-            magnet = self.find_xml_attribute(child, 'link')
-            size = self.find_xml_attribute(child, 'size')
-            indexer = self.find_xml_attribute(child, 'jackettindexer')
-            foundUploader = re.findall(r'-1? *\w*', title)
-            if len(foundUploader) > 0:
-                uploader = str(foundUploader[-1][1:])
-            else:
-                uploader = ''
-            seeders = 0
-            peers = 0
-
-            for elm in child.findall('{http://torznab.com/schemas/2015/feed}attr'):
-                if elm.get('name') == 'seeders':
-                    seeders = elm.get('value')
-                if elm.get('name') == 'peers':
-                    peers = elm.get('value')
-                try:
-                    size = int(size)
-                    size = humanize.naturalsize(size)
-                except ValueError:
-                    pass
-
-            logger.debug('Found torrent with info: \n\ttitle: %s\n\tmagnet: %s\n\tsize: \
-                %s\n\tdate: %s \n\tseeders: %s\n\tpeers: %s', \
-                    title, magnet, size, date, seeders, peers)
-            torrent = TorrentResult(title,
-                                    '?',
-                                    '?',
-                                    seeders,
-                                    size,
-                                    f'{indexer} - {uploader}',
-                                    magnet)
-            torrent.quality = torrent.find_release_type()
-            # Let's just skip cam torrent...
-            if 'cam' in torrent.quality:
-                continue
-            results.append(torrent)
-
-        return results
+        workers = workers or self.parseWorkers
+        if workers is None:
+            itemCount = len(ITEM_START_REGEX.findall(rawXml))
+            workers = (os.cpu_count() or 1) if itemCount >= PARALLEL_THRESHOLD else 1
+        workers = min(workers, MAX_PARSE_WORKERS)
+        items = None
+        if workers > 1:
+            pool = None
+            try:
+                pool = get_parse_pool()
+                chunks = list(pool.map(
+                    functools.partial(parse_items_chunk, filterSpec=self.filterSpec),
+                    split_feed_items(rawXml, workers)))
+                items = [fields for chunk, _ in chunks for fields in chunk]
+                self.filteredCount = sum(filtered for _, filtered in chunks)
+            except BrokenExecutor as e:
+                logger.warning('Parse pool broken, falling back to serial: %s', e)
+                if pool is not None:
+                    discard_parse_pool(pool)
+            except (ET.ParseError, OSError, ValueError, pickle.PicklingError) as e:
+                logger.warning('Parallel parsing failed, falling back to serial: %s', e)
+        if items is None:
+            channel = ET.fromstring(rawXml).find('channel')
+            extracted = [extract_item(child, self.filterSpec)
+                         for child in channel.findall('item')]
+            items = [fields for fields in extracted if fields is not None]
+            self.filteredCount = len(extracted) - len(items)
+        logger.debug('Jackett feed: %d torrents kept, %d filtered out', len(items),
+                     self.filteredCount)
+        return [TorrentResult(title, quality, '?', seeders, size, provider, magnet,
+                              infoHash=infoHash, sizeBytes=sizeBytes)
+                for title, quality, seeders, size, sizeBytes, provider, magnet, infoHash in items]
@@ -0,0 +1,211 @@
+'''
+Module providing an opt-in memory profiling mode for the search pipelines.
+When enabled, with the PYIMDBMOVIEFINDER_MEMPROFILE environment variable set to a report path
+or through enable(), tracemalloc tracks allocations and every profiled stage records its peak
+memory and top allocation sites. The report is a JSON document written at exit.
+When disabled, stages cost a single attribute check.
+'''
+from contextlib import contextmanager
+import atexit
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger('pyimdbmoviefinder')
+ENV_VAR = 'PYIMDBMOVIEFINDER_MEMPROFILE'
+DEFAULT_TOP_SITES = 10
+TRACEBACK_FRAMES = 5
+
+
+class MemoryProfiler:
+    """Collects per stage memory statistics using tracemalloc
+    """
+
+    def __init__(self):
+        """Constructor
+        """
+        self.enabled = False
+        self.reportPath = None
+        self.pid = os.getpid()
+        self.topSites = DEFAULT_TOP_SITES
+        self.stages = {}
+        self.lock = threading.Lock()
+        # Stages running in any thread, as {'peak': bytes} frames
+        self.openFrames = []
+        self.peakLock = threading.Lock()
+
+    def enable(self, reportPath: str = None, topSites: int = DEFAULT_TOP_SITES):
+        """Start tracing allocations
+
+        Args:
+            reportPath (str, optional): JSON report written at exit. Defaults to None.
+            topSites (int, optional): Allocation sites kept per stage. Defaults to 10.
+        """
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(TRACEBACK_FRAMES)
+        self.topSites = topSites
+        if reportPath and not self.reportPath:
+            atexit.register(self.write_report)
+        self.reportPath = reportPath or self.reportPath
+        self.pid = os.getpid()
+        self.enabled = True
+        logger.info("Memory profiling enabled, report: %s", self.reportPath)
+
+    def disable(self):
+        """Stop tracing allocations
+        """
+        self.enabled = False
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Profile a pipeline stage. Peaks are process wide, so concurrent stages account
+        for each other's allocations. As tracemalloc has a single peak counter, starting a
+        stage folds the peak reached so far into every stage open in any thread before
+        resetting it.
+
+        Args:
+            name (str): Stage name
+
+        Yields:
+            None
+        """
+        if not self.enabled:
+            yield
+            return
+        start = tracemalloc.take_snapshot()
+        with self.peakLock:
+            current, peak = tracemalloc.get_traced_memory()
+            for frame in self.openFrames:
+                frame['peak'] = max(frame['peak'], peak)
+            tracemalloc.reset_peak()
+            frame = {'peak': current}
+            self.openFrames.append(frame)
+        startTime = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - startTime
+            with self.peakLock:
+                self.openFrames.remove(frame)
+                end, peak = tracemalloc.get_traced_memory()
+                peak = max(frame['peak'], peak)
+            sites = self.top_sites(start, tracemalloc.take_snapshot())
+            self.record(name, elapsed, peak - current, end - current, sites)
+
+    def top_sites(self, start, end):
+        """Compute the allocation sites which grew the most between two snapshots
+
+        Args:
+            start (tracemalloc.Snapshot): Snapshot at stage start
+            end (tracemalloc.Snapshot): Snapshot at stage end
+
+        Returns:
+            List[dict]: Allocation sites, largest growth first
+        """
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                   tracemalloc.Filter(False, __file__)]
+        stats = end.filter_traces(filters).compare_to(start.filter_traces(filters), 'lineno')
+        return [{'file': stat.traceback[0].filename,
+                 'line': stat.traceback[0].lineno,
+                 'sizeDiff': stat.size_diff,
+                 'countDiff': stat.count_diff}
+                for stat in stats[:self.topSites] if stat.size_diff > 0]
+
+    def record(self, name, elapsed, peak, net, sites):
+        #pylint: disable=too-many-arguments
+        """Aggregate the measures of a stage run
+
+        Args:
+            name (str): Stage name
+            elapsed (float): Duration in seconds
+            peak (int): Peak memory above the stage start, in bytes
+            net (int): Memory retained at the end of the stage, in bytes
+            sites (List[dict]): Top allocation sites of this run
+        """
+        with self.lock:
+            stats = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'peakBytes': 0,
+                                                  'netBytes': 0, 'maxNetBytes': 0,
+                                                  'topSites': []})
+            stats['calls'] += 1
+            stats['seconds'] += elapsed
+            stats['peakBytes'] = max(stats['peakBytes'], peak)
+            stats['netBytes'] += net
+            if net >= stats['maxNetBytes']:
+                # Keep the allocation sites of the run retaining the most memory
+                stats['maxNetBytes'] = net
+                stats['topSites'] = sites
+
+    def report(self) -> dict:
+        """Build the profiling report
+
+        Returns:
+            dict: Traced memory and per stage statistics
+        """
+        current, peak = tracemalloc.get_traced_memory() if tracemalloc.is_tracing() else (0, 0)
+        with self.lock:
+            stages = {name: dict(stats) for name, stats in self.stages.items()}
+        return {'pid': os.getpid(), 'tracedBytes': current, 'tracedPeakBytes': peak,
+                'stages': stages}
+
+    def write_report(self, path: str = None):
+        """Write the profiling report as JSON
+
+        Args:
+            path (str, optional): Report path. Defaults to the path given to enable().
+        """
+        path = path or self.reportPath
+        if not path or os.getpid() != self.pid:
+            # Nothing to write, or in a worker process inheriting the profiler
+            return
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, indent=2)
+        logger.info("Memory profiling report written to %s", path)
+
+
+_PROFILER = MemoryProfiler()
+if os.environ.get(ENV_VAR):
+    _PROFILER.enable(os.environ[ENV_VAR])
+
+
+def get_memory_profiler() -> MemoryProfiler:
+    """Get the process wide memory profiler
+
+    Returns:
+        MemoryProfiler: The memory profiler
+    """
+    return _PROFILER
+
+
+def profile_stage(name: str):
+    """Profile a pipeline stage with the process wide memory profiler
+
+    Args:
+        name (str): Stage name
+
+    Returns:
+        ContextManager: The stage context
+    """
+    return _PROFILER.stage(name)
+
+
+def profiled(name: str):
+    """Decorator profiling every call of a function as a stage
+
+    Args:
+        name (str): Stage name
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _PROFILER.enabled:
+                return func(*args, **kwargs)
+            with _PROFILER.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
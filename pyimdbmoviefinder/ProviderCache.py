@@ -0,0 +1,150 @@
+'''
+Module used to remember which providers recently had nothing for a title, and which providers
+are failing, so they are not queried again before a retry time.
+Empty results are cached per (IMDb ID, provider) for a short time. Provider errors put the
+whole provider in an exponential backoff, reset by its next successful call.
+'''
+from typing import Dict, Tuple
+import logging
+import threading
+import time
+
+logger = logging.getLogger('pyimdbmoviefinder')
+DEFAULT_NEGATIVE_TTL = 30 * 60
+DEFAULT_BASE_RETRY = 30
+DEFAULT_MAX_RETRY = 60 * 60
+DEFAULT_MAX_ENTRIES = 10000
+
+
+class ProviderCache:
+    """Thread safe negative-result cache and provider error backoff
+    """
+
+    def __init__(self, negativeTtl: float = DEFAULT_NEGATIVE_TTL,
+                 baseRetry: float = DEFAULT_BASE_RETRY, maxRetry: float = DEFAULT_MAX_RETRY,
+                 maxEntries: int = DEFAULT_MAX_ENTRIES):
+        """Constructor
+
+        Args:
+            negativeTtl (float, optional): Seconds an empty result is remembered.
+                Defaults to 30 minutes.
+            baseRetry (float, optional): Backoff after the first provider error in seconds,
+                doubled by every following error. Defaults to 30.
+            maxRetry (float, optional): Max backoff in seconds. Defaults to 1 hour.
+            maxEntries (int, optional): Max number of empty results remembered.
+                Defaults to 10000.
+        """
+        self.negativeTtl = negativeTtl
+        self.baseRetry = baseRetry
+        self.maxRetry = maxRetry
+        self.maxEntries = maxEntries
+        # (imdbId, provider) -> (expiry, message)
+        self.empty: Dict[Tuple[str, str], Tuple[float, str]] = {}
+        # provider -> (retry time, consecutive errors, message)
+        self.failing: Dict[str, Tuple[float, int, str]] = {}
+        self.lock = threading.Lock()
+
+    def check(self, imdbId: str, provider: str):
+        """Tell if a provider should be skipped for a title
+
+        Args:
+            imdbId (str): IMDb ID
+            provider (str): Provider name
+
+        Returns:
+            tuple[bool, str] | None: None if the provider should be queried, otherwise
+                (False, message) while the provider is in error backoff, or
+                (None, message) if it recently had no result for the title
+        """
+        now = time.monotonic()
+        with self.lock:
+            failing = self.failing.get(provider)
+            if failing and failing[0] > now:
+                return False, f"{provider} skipped after error, retry in " \
+                    f"{int(failing[0] - now)}s: {failing[2]}"
+            empty = self.empty.get((imdbId, provider))
+            if empty:
+                if empty[0] > now:
+                    return None, empty[1]
+                del self.empty[(imdbId, provider)]
+        return None
+
+    def record_empty(self, imdbId: str, provider: str, message: str = ""):
+        """Remember that a provider had no result for a title
+
+        Args:
+            imdbId (str): IMDb ID
+            provider (str): Provider name
+            message (str, optional): Message reported while the result is cached
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.failing.pop(provider, None)
+            if len(self.empty) >= self.maxEntries:
+                self.prune(now)
+            self.empty[(imdbId, provider)] = (now + self.negativeTtl,
+                                              message or f"No torrents found on {provider}")
+
+    def record_success(self, provider: str):
+        """Reset the error backoff of a provider
+
+        Args:
+            provider (str): Provider name
+        """
+        with self.lock:
+            self.failing.pop(provider, None)
+
+    def record_error(self, provider: str, message: str = "") -> float:
+        """Put a provider in error backoff, doubling the delay at each consecutive error.
+        Errors reported while the provider is already backing off, ie. by concurrent searches
+        failing during the same outage, are not counted.
+
+        Args:
+            provider (str): Provider name
+            message (str, optional): Error message
+
+        Returns:
+            float: Delay before the provider is retried in seconds
+        """
+        now = time.monotonic()
+        with self.lock:
+            retryAt, errors, _ = self.failing.get(provider, (0, 0, ''))
+            if retryAt > now:
+                return retryAt - now
+            errors += 1
+            delay = min(self.maxRetry, self.baseRetry * 2 ** (errors - 1))
+            self.failing[provider] = (now + delay, errors, message)
+        logger.warning("%s failed %d times, retry in %ds", provider, errors, delay)
+        return delay
+
+    def prune(self, now: float):
+        """Drop expired empty results, then the oldest ones if still over maxEntries.
+        Must be called with the lock held.
+
+        Args:
+            now (float): time.monotonic() reference
+        """
+        self.empty = {key: value for key, value in self.empty.items() if value[0] > now}
+        overflow = len(self.empty) - self.maxEntries + 1
+        if overflow > 0:
+            for key, _ in sorted(self.empty.items(), key=lambda item: item[1][0])[:overflow]:
+                del self.empty[key]
+
+    def clear(self):
+        """Forget all cached results and backoffs
+        """
+        with self.lock:
+            self.empty = {}
+            self.failing = {}
+
+
+_SHARED_CACHE = ProviderCache()
+
+
+def get_provider_cache() -> ProviderCache:
+    """Get the process wide provider cache shared by all torrent searchers
+
+    Returns:
+        ProviderCache: The shared provider cache
+    """
+    return _SHARED_CACHE
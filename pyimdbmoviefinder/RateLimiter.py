@@ -0,0 +1,226 @@
+'''
+Module used to keep the request rate of every provider below its limits.
+Each host gets a token bucket bounding the request rate and a semaphore bounding the number
+of requests in flight. Callers over budget wait for their turn instead of failing.
+'''
+from contextlib import contextmanager
+from urllib import parse
+import configparser
+import logging
+import threading
+import time
+
+logger = logging.getLogger('pyimdbmoviefinder')
+DEFAULT_RATE = 2.0
+DEFAULT_BURST = 4
+DEFAULT_MAX_IN_FLIGHT = 4
+CONFIG_SECTION = 'RateLimit'
+
+
+def check_limits(rate: float, burst: int, maxInFlight: int):
+    """Validate rate limit values
+
+    Args:
+        rate (float): Max requests per second
+        burst (int): Max requests sent back to back
+        maxInFlight (int): Max concurrent requests
+
+    Raises:
+        ValueError: If a value is not positive
+    """
+    if rate <= 0:
+        raise ValueError(f"Rate must be positive, got {rate}")
+    if burst < 1:
+        raise ValueError(f"Burst must be at least 1, got {burst}")
+    if maxInFlight < 1:
+        raise ValueError(f"MaxInFlight must be at least 1, got {maxInFlight}")
+
+
+class TokenBucket:
+    """Thread safe token bucket
+    """
+
+    def __init__(self, rate: float, burst: int):
+        """Constructor
+
+        Args:
+            rate (float): Tokens added per second
+            burst (int): Max number of tokens stored
+
+        Raises:
+            ValueError: If rate or burst is not positive
+        """
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"Invalid token bucket rate {rate} / burst {burst}")
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def acquire(self):
+        """Take a token, waiting until one is available
+        """
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class HostLimit:
+    """Rate and concurrency limits of a single host
+    """
+
+    def __init__(self, rate: float, burst: int, maxInFlight: int):
+        """Constructor
+
+        Args:
+            rate (float): Max requests per second
+            burst (int): Max requests sent back to back
+            maxInFlight (int): Max concurrent requests
+        """
+        self.bucket = TokenBucket(rate, burst)
+        self.inFlight = threading.BoundedSemaphore(maxInFlight)
+
+    @contextmanager
+    def acquire(self):
+        """Wait for a free slot and a token
+
+        Yields:
+            None
+        """
+        with self.inFlight:
+            self.bucket.acquire()
+            yield
+
+
+class RateLimiter:
+    """Registry of rate limits keyed by host
+    """
+
+    def __init__(self, rate: float = DEFAULT_RATE, burst: int = DEFAULT_BURST,
+                 maxInFlight: int = DEFAULT_MAX_IN_FLIGHT):
+        """Constructor
+
+        Args:
+            rate (float, optional): Default max requests per second. Defaults to 2.
+            burst (int, optional): Default max requests back to back. Defaults to 4.
+            maxInFlight (int, optional): Default max concurrent requests. Defaults to 4.
+
+        Raises:
+            ValueError: If a limit is not positive
+        """
+        check_limits(rate, burst, maxInFlight)
+        self.defaults = (rate, burst, maxInFlight)
+        self.overrides = {}
+        self.hosts = {}
+        self.lock = threading.Lock()
+
+    def configure_host(self, host: str, rate: float = None, burst: int = None,
+                       maxInFlight: int = None):
+        """Set the limits of a specific host. Unset values use the defaults.
+
+        Args:
+            host (str): Host name (ie. yts.mx)
+            rate (float, optional): Max requests per second
+            burst (int, optional): Max requests sent back to back
+            maxInFlight (int, optional): Max concurrent requests
+
+        Raises:
+            ValueError: If a limit is not positive
+        """
+        defRate, defBurst, defMaxInFlight = self.defaults
+        limits = (defRate if rate is None else rate, defBurst if burst is None else burst,
+                  defMaxInFlight if maxInFlight is None else maxInFlight)
+        check_limits(*limits)
+        with self.lock:
+            self.overrides[host] = limits
+            self.hosts.pop(host, None)
+
+    def load_config(self, config: configparser.ConfigParser):
+        """Load limits from a config.ini, ie:
+        [RateLimit]
+        Rate = 2
+        Burst = 4
+        MaxInFlight = 4
+
+        [RateLimit yts.mx]
+        Rate = 1
+
+        Invalid sections are logged and ignored, keeping the previous limits.
+
+        Args:
+            config (configparser.ConfigParser): The parsed config
+        """
+        if config.has_section(CONFIG_SECTION):
+            section = config[CONFIG_SECTION]
+            try:
+                defaults = (section.getfloat('Rate', DEFAULT_RATE),
+                            section.getint('Burst', DEFAULT_BURST),
+                            section.getint('MaxInFlight', DEFAULT_MAX_IN_FLIGHT))
+                check_limits(*defaults)
+                self.defaults = defaults
+            except ValueError as e:
+                logger.error("Invalid rate limit configuration [%s]: %s", CONFIG_SECTION, e)
+        for name in config.sections():
+            if not name.startswith(CONFIG_SECTION + ' '):
+                continue
+            section = config[name]
+            try:
+                self.configure_host(name.split(' ', 1)[1].strip(),
+                                    section.getfloat('Rate', None),
+                                    section.getint('Burst', None),
+                                    section.getint('MaxInFlight', None))
+            except ValueError as e:
+                logger.error("Invalid rate limit configuration [%s]: %s", name, e)
+        with self.lock:
+            self.hosts = {}
+
+    def get_host_limit(self, host: str) -> HostLimit:
+        """Get the limits of a host, created on first use
+
+        Args:
+            host (str): Host name
+
+        Returns:
+            HostLimit: The host limits
+        """
+        with self.lock:
+            limit = self.hosts.get(host)
+            if limit is None:
+                limit = HostLimit(*self.overrides.get(host, self.defaults))
+                self.hosts[host] = limit
+            return limit
+
+    @contextmanager
+    def limit(self, url: str):
+        """Wait until a request to the url is allowed, holding an in flight slot
+        for the duration of the context
+
+        Args:
+            url (str): The requested url
+
+        Yields:
+            None
+        """
+        host = parse.urlparse(url).hostname or ''
+        with self.get_host_limit(host).acquire():
+            yield
+
+
+_SHARED_LIMITER = RateLimiter()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Get the process wide rate limiter shared by all fetchers
+
+    Returns:
+        RateLimiter: The shared rate limiter
+    """
+    return _SHARED_LIMITER
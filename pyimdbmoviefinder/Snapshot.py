@@ -0,0 +1,192 @@
+'''
+Module used to save searcher state to a compact binary snapshot and load it back lazily.
+
+File layout (little endian):
+    header  : magic "PYMF", format version (u16), kind (u16), entry count (u32),
+              index offset (u64)
+    records : one compact JSON object per entry, mapping field names to values
+    index   : per entry, key length (u16), key (utf-8), record offset (u64), record length (u32)
+
+The reader memory-maps the file and only parses the index, records are decoded on access.
+Records are keyed by field name, so fields added or removed by other versions of the
+dataclasses are tolerated (see to_record / from_record), including in shared caches.
+'''
+from typing import Iterable, Tuple
+from dataclasses import asdict, fields
+import json
+import logging
+import mmap
+import os
+import struct
+
+logger = logging.getLogger('pyimdbmoviefinder')
+MAGIC = b'PYMF'
+VERSION = 2
+KIND_MOVIES = 1
+KIND_TORRENTS = 2
+HEADER = struct.Struct('<4sHHIQ')
+INDEX_KEY = struct.Struct('<H')
+INDEX_VALUE = struct.Struct('<QI')
+
+
+class SnapshotError(Exception):
+    """Raised when a snapshot file or record is invalid or of an unexpected kind
+    """
+
+
+def to_record(obj) -> dict:
+    """Encode a dataclass as a record, nested dataclasses included
+
+    Args:
+        obj: The dataclass instance
+
+    Returns:
+        dict: Field name -> JSON serializable value
+    """
+    return asdict(obj)
+
+
+def from_record(cls, record):
+    """Build a dataclass from a record. Unknown fields, written by another version, are
+    ignored and missing fields take their default value.
+
+    Args:
+        cls (type): The dataclass
+        record (dict): Field name -> value
+
+    Raises:
+        SnapshotError: If the record is not a mapping or misses a required field
+
+    Returns:
+        The dataclass instance
+    """
+    if not isinstance(record, dict):
+        raise SnapshotError(f"invalid {cls.__name__} record: {type(record).__name__}")
+    names = {field.name for field in fields(cls) if field.init}
+    try:
+        return cls(**{name: value for name, value in record.items() if name in names})
+    except TypeError as e:
+        raise SnapshotError(f"invalid {cls.__name__} record: {e}") from e
+
+
+def write_snapshot(path: str, kind: int, entries: Iterable[Tuple[str, list]]) -> int:
+    """Write entries to a snapshot file. The file is replaced atomically.
+
+    Args:
+        path (str): Snapshot file path
+        kind (int): Kind of entries (KIND_MOVIES or KIND_TORRENTS)
+        entries (Iterable[Tuple[str, dict]]): (key, record) pairs, see to_record
+
+    Returns:
+        int: Number of entries written
+    """
+    tmpPath = path + '.tmp'
+    index = []
+    with open(tmpPath, 'wb') as f:
+        f.write(b'\0' * HEADER.size)
+        for key, values in entries:
+            record = json.dumps(values, separators=(',', ':')).encode()
+            index.append((key.encode(), f.tell(), len(record)))
+            f.write(record)
+        indexOffset = f.tell()
+        for key, offset, length in index:
+            f.write(INDEX_KEY.pack(len(key)) + key + INDEX_VALUE.pack(offset, length))
+        f.seek(0)
+        f.write(HEADER.pack(MAGIC, VERSION, kind, len(index), indexOffset))
+    os.replace(tmpPath, path)
+    logger.debug("Wrote %d entries to snapshot %s", len(index), path)
+    return len(index)
+
+
+class SnapshotReader:
+    """Memory-mapped snapshot reader decoding records on demand
+    """
+
+    def __init__(self, path: str, kind: int):
+        """Constructor
+
+        Args:
+            path (str): Snapshot file path
+            kind (int): Expected kind of entries
+
+        Raises:
+            SnapshotError: If the file is not a valid snapshot of the expected kind
+        """
+        with open(path, 'rb') as f:
+            try:
+                self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError as e:
+                # Empty file
+                raise SnapshotError(f"Invalid snapshot {path}: {e}") from e
+        try:
+            self.index = self.read_index(kind)
+        except (SnapshotError, struct.error, ValueError) as e:
+            self.map.close()
+            raise SnapshotError(f"Invalid snapshot {path}: {e}") from e
+
+    def read_index(self, kind: int) -> dict:
+        """Parse the header and index of the snapshot
+
+        Args:
+            kind (int): Expected kind of entries
+
+        Returns:
+            dict: key -> (record offset, record length)
+        """
+        magic, version, fileKind, count, pos = HEADER.unpack_from(self.map, 0)
+        if magic != MAGIC or version != VERSION:
+            raise SnapshotError(f"unsupported format {magic}, version {version}")
+        if fileKind != kind:
+            raise SnapshotError(f"expected kind {kind}, found {fileKind}")
+        index = {}
+        for _ in range(count):
+            keyLen, = INDEX_KEY.unpack_from(self.map, pos)
+            pos += INDEX_KEY.size
+            key = self.map[pos:pos + keyLen].decode()
+            pos += keyLen
+            index[key] = INDEX_VALUE.unpack_from(self.map, pos)
+            pos += INDEX_VALUE.size
+        return index
+
+    def get(self, key: str):
+        """Decode the record stored for a key
+
+        Args:
+            key (str): Entry key
+
+        Raises:
+            SnapshotError: If the record is truncated or corrupt
+
+        Returns:
+            dict | None: The record, None if the key is not in the snapshot
+        """
+        location = self.index.get(key)
+        if location is None:
+            return None
+        offset, length = location
+        try:
+            return json.loads(self.map[offset:offset + length])
+        except ValueError as e:
+            raise SnapshotError(f"corrupt record {key}: {e}") from e
+
+    def keys(self):
+        """Keys stored in the snapshot
+
+        Returns:
+            KeysView: The keys
+        """
+        return self.index.keys()
+
+    def __len__(self):
+        return len(self.index)
+
+    def close(self):
+        """Release the memory map
+        """
+        self.map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception, value, tb):
+        self.close()
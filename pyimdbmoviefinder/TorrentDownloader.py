@@ -3,8 +3,7 @@ This modules allows sending a magnet torrent link to a running transmission daem
 '''
 
 import logging
-from json import dumps
-import httplib2
+from pyimdbmoviefinder.TransmissionClient import TransmissionClient, TransmissionError
 
 logger = logging.getLogger('pyimdbmoviefinder')
 
@@ -13,12 +12,14 @@ class TorrentDownloader:
     Class allowing torrent download to a transmission daemon
     '''
 
-    def __init__(self, host, user, pw, directory=None):
+    def __init__(self, host, user, pw, directory=None, cache=None):
+        #pylint: disable=too-many-arguments
         '''Constructor'''
         self.host = host
         self.user = user
         self.pw = pw
         self.dir = directory
+        self.client = TransmissionClient(host, user, pw, cache=cache)
 
     def add_torrent_magnet(self, magnetLink: str) -> tuple[bool, str]:
         """Forward the magnet link to transmission daemon through RPC
@@ -29,27 +30,14 @@ class TorrentDownloader:
         Returns:
             tuple[bool, str]: Boolean result and String describing success / failure
         """
-        h = httplib2.Http(".cache")
-        h.add_credentials(self.user, self.pw)
         try:
-            resp, content = h.request(self.host, "GET")
-        except Exception as e: #pylint: disable=broad-exception-caught
-            return False, ("Unable to send the request, verify your config : %s", str(e))
-        if not 'x-transmission-session-id' in resp.keys():
-            return False, "Response missing x-transmission-session-id, check your \
-                hostname/user/password or webserver configuration !"
-        headers = {
-            "X-Transmission-Session-Id": resp['x-transmission-session-id']}
-        args = {"filename": magnetLink}
-        if self.dir:
-            args['download-dir'] = self.dir
-        body = dumps({"method": "torrent-add",
-                      "arguments": args})
-        _, content = h.request(self.host, 'POST', headers=headers, body=body)
-
-        if str(content).find("success") == -1:
+            torrent = self.client.torrent_add(magnetLink, self.dir)
+        except TransmissionError as e:
             logger.error("ERROR: Magnet Link: %s", magnetLink)
-            logger.error("ERROR: Answer: %s", str(content))
-            return False, "An error occured while sending torrent to" + self.host + \
-                "Server answered \r\n" + str(content) + " \r\nMake sure the link is correct"
-        return True, "Successfully added " + magnetLink + self.host
+            logger.error("ERROR: Answer: %s", str(e))
+            return False, "An error occured while sending torrent to " + self.host + \
+                "\r\n" + str(e) + " \r\nMake sure the link is correct"
+        if torrent['duplicate']:
+            return True, f"Torrent already added to {self.host}: {torrent.get('name')}"
+        return True, f"Successfully added {torrent.get('name')} ({torrent.get('hashString')}) " \
+            f"to {self.host}"
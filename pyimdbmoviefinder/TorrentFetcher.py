@@ -2,8 +2,9 @@
 Base class for Torrent Fetcher classes
 '''
 from abc import abstractmethod
-from dataclasses import dataclass
-from typing import List
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+import re
 
 RELEASE_TYPES = ('bdremux', 'brremux', 'remux',
                  'bdrip', 'brrip', 'blu-ray', 'bluray', 'bdmv', 'bdr', 'bd5',
@@ -14,6 +15,39 @@ RELEASE_TYPES = ('bdremux', 'brremux', 'remux',
                  'dvdr', 'dvd-full', 'full-rip', 'iso',
                  'hdts', 'hdts', 'telesync', 'pdvd', 'predvdrip',
                  'camrip', 'cam', '720p', '1080p', '2160p')
+MAGNET_HASH_REGEX = re.compile(r'urn:btih:([0-9a-zA-Z]+)')
+
+
+def find_release_type(name: str, default=None):
+    """Find the release types embedded in a torrent name
+
+    Args:
+        name (str): The torrent name
+        default (optional): Value returned when no release type is found. Defaults to None.
+
+    Returns:
+        List[str]: The release types found, default if none
+    """
+    name = name.casefold()
+    release_type = [r_type for r_type in RELEASE_TYPES if r_type in name]
+    if len(release_type) == 0:
+        return default
+    return release_type
+
+
+def infohash_from_magnet(url: str) -> str:
+    """Extract the info hash from a magnet link
+
+    Args:
+        url (str): The magnet link
+
+    Returns:
+        str: The upper case info hash, or an empty string if the url is not a magnet link
+    """
+    if not url or not url.startswith('magnet:'):
+        return ''
+    found = MAGNET_HASH_REGEX.search(url)
+    return found.group(1).upper() if found else ''
 
 
 @dataclass
@@ -28,10 +62,16 @@ class TorrentResult():
     provider: str
     url: str
     description: str = ""
+    infoHash: str = ""
+    sizeBytes: int = 0
 
     def __post_init__(self):
         '''Constructor'''
         self.description = self.name + " " + str(self.find_release_type())
+        if self.infoHash:
+            self.infoHash = self.infoHash.upper()
+        else:
+            self.infoHash = infohash_from_magnet(self.url)
 
     def find_release_type(self):
         """Find the release type embedded in the title attribute
@@ -39,21 +79,230 @@ class TorrentResult():
         Returns:
             str: The release type found
         """
-        name = self.name.casefold()
-        release_type = [r_type for r_type in RELEASE_TYPES if r_type in name]
-        if len(release_type) == 0:
-            return self.quality
-        return release_type
+        return find_release_type(self.name, self.quality)
+
+
+@dataclass(frozen=True)
+class FilterSpec():
+    """Declarative torrent filter. Fetchers evaluate it on the raw fields of feed items,
+    before building TorrentResult objects, so rejected items cost as little as possible.
+    Names are matched case-insensitively, as substrings, like release types.
+    """
+    minSeeders: int = 0
+    # Allowed resolutions, ie. ('1080p', '2160p'). Empty allows any resolution.
+    resolutions: Tuple[str, ...] = ()
+    # Release types rejected, ie. ('cam', 'telesync')
+    excludedSources: Tuple[str, ...] = ()
+    # Size range in bytes, 0 for no bound. Items of unknown size are kept.
+    minSize: int = 0
+    maxSize: int = 0
+    # Set when combined filters have no resolution in common, nothing is accepted
+    rejectAll: bool = False
+
+    def accepts_release(self, name: str, resolution: str = None, source: str = None) -> bool:
+        """Check the release of an item
+
+        Args:
+            name (str): Torrent name
+            resolution (str, optional): Resolution field, if the provider has one. When
+                given, it is checked instead of the name. Defaults to None.
+            source (str, optional): Release type field, if the provider has one. When
+                given, it is checked instead of the name. Defaults to None.
+
+        Returns:
+            bool: True if the release is accepted
+        """
+        if self.rejectAll:
+            return False
+        if not self.resolutions and not self.excludedSources:
+            return True
+        if self.resolutions:
+            text = (resolution if resolution is not None else name).casefold()
+            if not any(res.casefold() in text for res in self.resolutions):
+                return False
+        if self.excludedSources:
+            text = (source if source is not None else name).casefold()
+            if any(src.casefold() in text for src in self.excludedSources):
+                return False
+        return True
+
+    def combine(self, other):
+        """Build the filter accepting only the items accepted by both filters. Allowed
+        resolutions are intersected, keeping the most specific of two matching names
+        (ie. '1080p' for '1080' and '1080p'); no common resolution rejects everything.
+
+        Args:
+            other (FilterSpec | None): The other filter
+
+        Returns:
+            FilterSpec: The combined filter
+        """
+        if other is None:
+            return self
+        rejectAll = self.rejectAll or other.rejectAll
+        if self.resolutions and other.resolutions:
+            resolutions = []
+            for res in self.resolutions:
+                for otherRes in other.resolutions:
+                    if otherRes.casefold() in res.casefold():
+                        resolutions.append(res)
+                    elif res.casefold() in otherRes.casefold():
+                        resolutions.append(otherRes)
+            resolutions = tuple(dict.fromkeys(resolutions))
+            rejectAll = rejectAll or not resolutions
+        else:
+            resolutions = self.resolutions or other.resolutions
+        maxSizes = [size for size in (self.maxSize, other.maxSize) if size]
+        return FilterSpec(max(self.minSeeders, other.minSeeders), resolutions,
+                          tuple(dict.fromkeys(self.excludedSources + other.excludedSources)),
+                          max(self.minSize, other.minSize), min(maxSizes) if maxSizes else 0,
+                          rejectAll)
+
+    def accepts_stats(self, seeds: int, sizeBytes: int) -> bool:
+        """Check the seeders and size of an item
+
+        Args:
+            seeds (int): Number of seeders
+            sizeBytes (int): Size in bytes, 0 if unknown
+
+        Returns:
+            bool: True if the item is accepted
+        """
+        if seeds < self.minSeeders:
+            return False
+        if sizeBytes and self.minSize and sizeBytes < self.minSize:
+            return False
+        if sizeBytes and self.maxSize and sizeBytes > self.maxSize:
+            return False
+        return True
+
+    def accepts(self, name: str, seeds: int, sizeBytes: int, resolution: str = None,
+                source: str = None) -> bool:
+        #pylint: disable=too-many-arguments
+        """Check all the fields of an item, cheapest checks first
+
+        Args:
+            name (str): Torrent name
+            seeds (int): Number of seeders
+            sizeBytes (int): Size in bytes, 0 if unknown
+            resolution (str, optional): Resolution field. Defaults to None.
+            source (str, optional): Release type field. Defaults to None.
+
+        Returns:
+            bool: True if the item is accepted
+        """
+        return self.accepts_stats(seeds, sizeBytes) and \
+            self.accepts_release(name, resolution, source)
+
+
+@dataclass
+class SearchQuery():
+    """Dataclass describing a torrent search, used to select and build fetchers
+    """
+    imdbId: str
+    title: str
+    isTv: bool = False
+    # Provider specific settings, ie. jackettApiKey / jackettHost
+    options: dict = field(default_factory=dict)
+    # None to use the default filter of each fetcher
+    filterSpec: FilterSpec = None
+
+
+@dataclass
+class FetcherInfo():
+    """Dataclass holding a registered fetcher class with its scheduling hints
+    """
+    name: str
+    fetcherClass: type
+    latency: float = 1.0
+    cost: float = 1.0
+    searchByImdbId: bool = False
+    supportsTv: bool = False
+
+    def can_serve(self, query: SearchQuery) -> bool:
+        """Tell if the fetcher is able to serve a query
+
+        Args:
+            query (SearchQuery): The search query
+
+        Returns:
+            bool: True if the fetcher can serve the query
+        """
+        if query.isTv and not self.supportsTv:
+            return False
+        if self.searchByImdbId:
+            return bool(query.imdbId)
+        return bool(query.title)
+
+
+FETCHER_REGISTRY: Dict[str, FetcherInfo] = {}
+
+
+def register_fetcher(name: str, latency: float = 1.0, cost: float = 1.0,
+                     searchByImdbId: bool = False, supportsTv: bool = False):
+    """Class decorator registering a TorrentFetcher subclass under a provider name.
+    The class must implement the from_query() class method.
+
+    Args:
+        name (str): Provider name
+        latency (float, optional): Expected latency of a search in seconds. Defaults to 1.0.
+        cost (float, optional): Relative cost of a search. Defaults to 1.0.
+        searchByImdbId (bool, optional): True if the fetcher searches by IMDb ID rather than
+            by title. Defaults to False.
+        supportsTv (bool, optional): True if the provider has TV shows. Defaults to False.
+    """
+    def decorator(fetcherClass):
+        fetcherClass.providerName = name
+        FETCHER_REGISTRY[name] = FetcherInfo(name, fetcherClass, latency, cost,
+                                             searchByImdbId, supportsTv)
+        return fetcherClass
+    return decorator
+
+
+def select_fetchers(query: SearchQuery, providers: List[str] = None) -> List[FetcherInfo]:
+    """Select the registered fetchers able to serve a query, cheapest and fastest first
+
+    Args:
+        query (SearchQuery): The search query
+        providers (List[str], optional): Allowed provider names. Defaults to all registered.
+
+    Returns:
+        List[FetcherInfo]: The selected fetchers, in scheduling order
+    """
+    candidates = [FETCHER_REGISTRY[name] for name in providers if name in FETCHER_REGISTRY] \
+        if providers is not None else list(FETCHER_REGISTRY.values())
+    return sorted((info for info in candidates if info.can_serve(query)),
+                  key=lambda info: (info.cost, info.latency))
+
 
 class TorrentFetcher:
     """Abstract Class for Torrent Fetcher classes
     """
+    # HTTP validators (etag, last modified, body digest) of the previous fetch, owned by the
+    # caller. When set, fetchers issue conditional requests and set unchanged to True instead
+    # of parsing a feed identical to the previous one.
+    validators: dict = None
+    unchanged: bool = False
+    # Set by register_fetcher
+    providerName: str = None
+
     def __init__(self):
         '''Constructor'''
 
+    @classmethod
+    @abstractmethod
+    def from_query(cls, query: SearchQuery):
+        '''Build the fetcher for a search query
+        raise:
+            ValueError: if the query misses settings required by the fetcher
+        return:
+            TorrentFetcher: the fetcher'''
+
     @abstractmethod
     def fetch(self) -> tuple[bool, List[TorrentResult]]:
         '''Run fetcher
         return:
-            bool: returns True if the fetcher encountered no issues
-            List: List of torrents found using the fetcher'''
+            bool: returns True if the fetcher encountered no issues (with an empty list if
+                the filter rejected all torrents), None if the provider has no torrent for the
+                search, False on errors
+            List: List of torrents found using the fetcher, or the error message'''
@@ -0,0 +1,132 @@
+'''
+Module used to speculatively search torrents for the top results of an IMDb search,
+while the user is still choosing, so the torrent list is ready once a choice is made.
+'''
+from typing import Dict, List
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+import logging
+import threading
+import time
+from pyimdbmoviefinder.ImdbSearcher import MovieData
+from pyimdbmoviefinder.TorrentSearcher import TorrentSearcher
+
+logger = logging.getLogger('pyimdbmoviefinder')
+DEFAULT_TOP_N = 3
+DEFAULT_BUDGET = 30.0
+
+
+class TorrentPrefetcher:
+    """Class running background torrent searches for likely user choices.
+    Results are stored in the target TorrentSearcher, so they are also available through
+    its get_torrents_data_from_id().
+    Searches run in daemon threads, so a search still waiting on a provider never delays the
+    interpreter exit.
+    """
+
+    def __init__(self, searcher: TorrentSearcher, searchOptions: dict = None,
+                 maxWorkers: int = DEFAULT_TOP_N, budget: float = DEFAULT_BUDGET):
+        """Constructor
+
+        Args:
+            searcher (TorrentSearcher): Searcher receiving the prefetched torrents
+            searchOptions (dict, optional): Keyword arguments forwarded to
+                TorrentSearcher.set_search (yts, jackett, jackettApiKey...). Defaults to None.
+            maxWorkers (int, optional): Max concurrent searches. Defaults to 3.
+            budget (float, optional): Seconds after which no new search is started and
+                results are dropped. Defaults to 30.
+        """
+        self.searcher = searcher
+        self.searchOptions = searchOptions or {}
+        self.maxWorkers = maxWorkers
+        self.budget = budget
+        self.futures: Dict[str, Future] = {}
+        self.cancelled = threading.Event()
+        self.deadline = 0.0
+
+    def prefetch(self, movies: List[MovieData], topN: int = DEFAULT_TOP_N):
+        """Start background torrent searches for the first results of an IMDb search.
+        Any previous prefetch is cancelled.
+
+        Args:
+            movies (List[MovieData]): IMDb search results, most likely first
+            topN (int, optional): Number of results to prefetch. Defaults to 3.
+        """
+        self.cancel()
+        self.cancelled = threading.Event()
+        self.deadline = time.monotonic() + self.budget
+        slots = threading.BoundedSemaphore(self.maxWorkers)
+        for movie in (movies or [])[:topN]:
+            if movie.imdbId not in self.futures:
+                logger.debug("Prefetching torrents for %s", movie.title)
+                future = Future()
+                self.futures[movie.imdbId] = future
+                threading.Thread(target=self._run, name=f'prefetch-{movie.imdbId}', daemon=True,
+                                 args=(future, slots, movie, self.cancelled,
+                                       self.deadline)).start()
+
+    def _run(self, future: Future, slots: threading.BoundedSemaphore, movie: MovieData,
+             cancelled: threading.Event, deadline: float):
+        #pylint: disable=too-many-arguments
+        if not slots.acquire(timeout=max(0.0, deadline - time.monotonic())):
+            # Out of budget, unless cancel() already cancelled the pending future
+            if future.set_running_or_notify_cancel():
+                future.set_result(None)
+            return
+        try:
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(self._search(movie, cancelled, deadline))
+            except Exception as e: #pylint: disable=broad-exception-caught
+                future.set_exception(e)
+        finally:
+            slots.release()
+
+    def _search(self, movie: MovieData, cancelled: threading.Event, deadline: float):
+        if cancelled.is_set() or time.monotonic() > deadline:
+            return None
+        searcher = TorrentSearcher(self.searcher.providerCache, self.searcher.resultCache,
+                                   self.searcher.resultTtl)
+        res, error = searcher.set_search(movie.imdbId, movie.title, isTv=movie.is_tv(),
+                                         **self.searchOptions)
+        data, errors = searcher.run(cancelled)
+        if not res:
+            errors = [error] + errors
+        if cancelled.is_set() or time.monotonic() > deadline:
+            return None
+        self.searcher.store(data)
+        return data, errors
+
+    def result(self, imdbId: str, timeout: float = None):
+        """Get the prefetched torrents of a movie, waiting for a running search to finish
+
+        Args:
+            imdbId (str): IMDb ID
+            timeout (float, optional): Max time to wait in seconds, bounded by the remaining
+                budget. Defaults to None.
+
+        Returns:
+            tuple[TorrentData, List] | None: Torrents and errors, as returned by
+                TorrentSearcher.run(), None if the movie was not prefetched in time
+        """
+        future = self.futures.get(imdbId)
+        if future is None or future.cancelled():
+            return None
+        remaining = max(0.0, self.deadline - time.monotonic())
+        try:
+            return future.result(min(timeout, remaining) if timeout is not None else remaining)
+        except FutureTimeoutError:
+            logger.debug("Prefetch of %s not ready in time", imdbId)
+        except Exception as e: #pylint: disable=broad-exception-caught
+            logger.warning("Prefetch of %s failed: %s", imdbId, e)
+        return None
+
+    def cancel(self):
+        """Cancel pending searches and drop the results of running ones. Running searches
+        skip their remaining providers; a request already sent is not interrupted and ends
+        in its daemon thread, without blocking the caller or the interpreter exit.
+        """
+        self.cancelled.set()
+        for future in self.futures.values():
+            future.cancel()
+        self.futures = {}
@@ -3,9 +3,22 @@ Module used by upper layer to start a torrent search using all available fetcher
 '''
 from typing import List
 from dataclasses import dataclass
-from pyimdbmoviefinder.YtsFetcher import YtsFetcher
-from pyimdbmoviefinder.JackettFetcher import JackettFetcher
-from pyimdbmoviefinder.TorrentFetcher import TorrentResult
+import http.client
+import logging
+import threading
+# Fetcher modules register themselves in the fetcher registry when imported
+import pyimdbmoviefinder.YtsFetcher #pylint: disable=unused-import
+import pyimdbmoviefinder.JackettFetcher #pylint: disable=unused-import
+from pyimdbmoviefinder.TorrentFetcher import TorrentResult, SearchQuery, FilterSpec, \
+    select_fetchers
+from pyimdbmoviefinder.CacheBackend import CacheBackend
+from pyimdbmoviefinder.Snapshot import KIND_TORRENTS, SnapshotError, SnapshotReader, \
+    from_record, to_record, write_snapshot
+from pyimdbmoviefinder.ProviderCache import ProviderCache, get_provider_cache
+from pyimdbmoviefinder.MemoryProfiler import profiled
+
+logger = logging.getLogger('pyimdbmoviefinder')
+DEFAULT_RESULT_TTL = 10 * 60
 
 
 @dataclass
@@ -16,20 +29,74 @@ class TorrentData():
     torrents: List[TorrentResult]
 
 
+def torrents_from_records(records) -> List[TorrentResult]:
+    """Decode a list of torrent records
+
+    Args:
+        records (list): Records written by to_record
+
+    Raises:
+        SnapshotError: If a record is invalid
+
+    Returns:
+        List[TorrentResult]: The torrents
+    """
+    if not isinstance(records, list):
+        raise SnapshotError(f"invalid torrents record: {type(records).__name__}")
+    return [from_record(TorrentResult, record) for record in records]
+
+
+def format_error(output) -> str:
+    """Format the error output of a fetcher, which may be a message or a
+    (format, arguments...) tuple
+
+    Args:
+        output (str | tuple): The fetcher error output
+
+    Returns:
+        str: The error message
+    """
+    if isinstance(output, (tuple, list)) and output:
+        try:
+            return str(output[0]) % tuple(output[1:])
+        except TypeError:
+            return " ".join(str(part) for part in output)
+    return str(output)
+
+
 class TorrentSearcher:
     """Class for searching torrents matching the provided IMDb ID
     """
-    def __init__(self):
+    def __init__(self, providerCache: ProviderCache = None, resultCache: CacheBackend = None,
+                 resultTtl: float = DEFAULT_RESULT_TTL):
         """Constructor
+
+        Args:
+            providerCache (ProviderCache, optional): Cache of empty results and provider
+                errors. Defaults to the process wide shared cache.
+            resultCache (CacheBackend, optional): Cache of the torrents found per provider,
+                possibly shared with other processes. Defaults to None (no cache).
+            resultTtl (float, optional): Seconds provider results are cached.
+                Defaults to 10 minutes.
         """
+        self.providerCache = providerCache if providerCache else get_provider_cache()
+        self.resultCache = resultCache
+        self.resultTtl = resultTtl
         self.fetchers = []
         self.torrentsList: List[TorrentData] = []
         self.imdbId = None
+        self.filterSpec: FilterSpec = None
+        self.snapshot: SnapshotReader = None
+        self.lock = threading.Lock()
 
     def set_search(self, imdbId: str, title: str, yts: bool = True, jackett: bool = True,
-                  jackettApiKey: str = None, jackettHost: str = None):
+                  jackettApiKey: str = None, jackettHost: str = None,
+                  providers: List[str] = None, isTv: bool = False,
+                  filterSpec: FilterSpec = None):
         #pylint: disable=too-many-arguments
-        """Prepare a torrent search
+        """Prepare a torrent search. Fetchers are picked from the fetcher registry, skipping
+        the ones unable to serve the query (ie. movie only providers for a TV show), and
+        ordered cheapest and fastest first.
 
         Args:
             imdbId (str): IMDb ID
@@ -38,22 +105,48 @@ class TorrentSearcher:
             jackett (bool, optional): True for searching using Jackett. Defaults to True.
             jackettApiKey (str, optional): Jackett API key. Defaults to None.
             jackettHost (str, optional): Jackett Host. Defaults to None.
+            providers (List[str], optional): Registered provider names to search, overrides
+                the yts/jackett flags. Defaults to None.
+            isTv (bool, optional): True if searching a TV show. Defaults to False.
+            filterSpec (FilterSpec, optional): Filter evaluated by the fetchers before building
+                results. It is combined with the default filter of each fetcher, so Jackett
+                still skips cam releases and torrents without seeders. Defaults to None.
 
         Returns:
-            _type_: True if all fetchers are ready, False otherwise
+            _type_: True if all fetchers are ready, False otherwise, ie. when no selected
+                provider can serve the query
         """
         self.imdbId = imdbId
-        if yts:
-            self.fetchers.append(YtsFetcher(imdbId))
-        if jackett:
-            if not jackettApiKey or not jackettHost:
-                return False, str("Set a valid API key/Host to use jackett indexers")
-            self.fetchers.append(JackettFetcher(
-                imdbId, title, jackettApiKey, jackettHost))
+        self.filterSpec = filterSpec
+        if providers is None:
+            providers = [name for name, enabled in (("YTS", yts), ("Jackett", jackett))
+                         if enabled]
+        query = SearchQuery(imdbId, title, isTv,
+                            {'jackettApiKey': jackettApiKey, 'jackettHost': jackettHost},
+                            filterSpec)
+        selected = select_fetchers(query, providers)
+        if not selected:
+            kind = "TV show" if isTv else "movie"
+            return False, (f"No selected provider can serve this query ({kind}): "
+                           f"{', '.join(providers) or 'none'}")
+        errors = []
+        for info in selected:
+            try:
+                self.fetchers.append(info.fetcherClass.from_query(query))
+            except ValueError as e:
+                errors.append(str(e))
+        if errors:
+            return False, "\n".join(errors)
         return True, ""
 
-    def run(self):
-        """Run the torrent search
+    @profiled("torrents.run")
+    def run(self, cancelled: threading.Event = None):
+        """Run the torrent search. Providers that recently had no torrent for the title, or
+        that are in error backoff, are skipped and reported from the provider cache.
+
+        Args:
+            cancelled (threading.Event, optional): When set, the remaining fetchers are
+                skipped. Defaults to None.
 
         Returns:
             List: List of found torrent for the search specified in set_search
@@ -61,21 +154,86 @@ class TorrentSearcher:
         result = []
         errors = []
         for fetcher in self.fetchers:
-            res, output = fetcher.fetch()
-            if res and output is not None:
+            if cancelled is not None and cancelled.is_set():
+                break
+            provider = fetcher.providerName or type(fetcher).__name__
+            cached = self.providerCache.check(self.imdbId, provider)
+            if cached is not None:
+                errors.append(cached[1])
+                continue
+            key = self._result_key(provider)
+            torrents = self._load_cached_torrents(key)
+            if torrents:
+                result += torrents
+                continue
+            try:
+                res, output = fetcher.fetch()
+            except (OSError, http.client.HTTPException) as e:
+                # Provider unreachable, requests and urllib errors are OSError
+                res, output = False, f"{provider}: {e}"
+            except Exception as e: #pylint: disable=broad-exception-caught
+                # Specific to this title (ie. malformed payload), no provider backoff
+                errors.append(f"{provider}: {e}")
+                continue
+            if res and output:
+                self.providerCache.record_success(provider)
+                self._store_cached_torrents(key, output)
                 result += output
-            elif not res:
+            elif res is False:
                 # Something went wrong with this fetcher
-                errors += output
+                message = format_error(output)
+                self.providerCache.record_error(provider, message)
+                errors.append(message)
+            elif res:
+                # Torrents all rejected by the filter, or feed unchanged
+                self.providerCache.record_success(provider)
+            else:
+                # No torrent for this title yet, reported the same way while cached
+                message = output if isinstance(output, str) and output else \
+                    f"No torrents found on {provider}"
+                self.providerCache.record_empty(self.imdbId, provider, message)
+                errors.append(message)
         newTorrents = TorrentData(self.imdbId, result)
-        existing = self.get_torrents_data_from_id(self.imdbId)
-        if existing:
-            existing.torrents = result
-        else:
-            self.torrentsList.append(newTorrents)
+        self.store(newTorrents)
         self.fetchers = []
         return newTorrents, errors
 
+    def _result_key(self, provider):
+        key = f"torrents:{provider}:{self.imdbId}"
+        if self.filterSpec is not None:
+            key += f":{self.filterSpec!r}"
+        return key
+
+    def _store_cached_torrents(self, key, torrents):
+        if self.resultCache is not None:
+            self.resultCache.set(key, [to_record(torrent) for torrent in torrents],
+                                 self.resultTtl)
+
+    def _load_cached_torrents(self, key):
+        if self.resultCache is None:
+            return None
+        records = self.resultCache.get(key)
+        if not records:
+            return None
+        try:
+            return torrents_from_records(records)
+        except SnapshotError as e:
+            logger.debug("Ignoring cached torrents %s: %s", key, e)
+            return None
+
+    def store(self, data: TorrentData):
+        """Store torrent data, replacing the torrents previously found for the same ID
+
+        Args:
+            data (TorrentData): The torrent data
+        """
+        with self.lock:
+            existing = self.get_torrents_data_from_id(data.imdbId)
+            if existing:
+                existing.torrents = data.torrents
+            else:
+                self.torrentsList.append(data)
+
     def get_torrents_data_from_id(self, imdbId):
         """Find all found torrents data from an IMDb ID
 
@@ -88,6 +246,19 @@ class TorrentSearcher:
         for data in self.torrentsList:
             if data.imdbId == imdbId:
                 return data
+        if self.snapshot is not None:
+            try:
+                values = self.snapshot.get(imdbId)
+                if values is None:
+                    return None
+                if not isinstance(values, dict):
+                    raise SnapshotError(f"invalid torrent data: {type(values).__name__}")
+                data = TorrentData(imdbId, torrents_from_records(values.get('torrents')))
+            except SnapshotError as e:
+                logger.warning("Ignoring snapshot torrents %s: %s", imdbId, e)
+                return None
+            self.torrentsList.append(data)
+            return data
         return None
 
     def get_torrents_from_id(self, imdbId):
@@ -99,12 +270,53 @@ class TorrentSearcher:
         Returns:
             TorrentResult | None: the TorrentResult object if found, None otherwise
         """
-        for data in self.torrentsList:
-            if data.imdbId == imdbId:
-                return data.torrents
-        return None
+        data = self.get_torrents_data_from_id(imdbId)
+        return data.torrents if data else None
 
     def clear(self):
         """Clear all torrent data from the list
         """
         self.torrentsList = []
+        if self.snapshot is not None:
+            self.snapshot.close()
+            self.snapshot = None
+
+    def save_state(self, path: str) -> int:
+        """Save all found torrents, including the ones not loaded yet from a previous snapshot,
+        to a snapshot file
+
+        Args:
+            path (str): Snapshot file path
+
+        Returns:
+            int: Number of torrent data saved
+        """
+        entries = {data.imdbId: to_record(data) for data in self.torrentsList}
+        if self.snapshot is not None:
+            for imdbId in self.snapshot.keys():
+                if imdbId not in entries:
+                    try:
+                        entries[imdbId] = self.snapshot.get(imdbId)
+                    except SnapshotError as e:
+                        logger.warning("Dropping snapshot torrents %s: %s", imdbId, e)
+        return write_snapshot(path, KIND_TORRENTS, entries.items())
+
+    def load_state(self, path: str) -> int:
+        """Restore torrents from a snapshot file. Torrents are decoded lazily when looked up
+        by ID.
+
+        Args:
+            path (str): Snapshot file path
+
+        Raises:
+            SnapshotError: If the file is not a valid torrents snapshot
+
+        Returns:
+            int: Number of torrent data available in the snapshot
+        """
+        snapshot = SnapshotReader(path, KIND_TORRENTS)
+        if self.snapshot is not None:
+            self.snapshot.close()
+        self.snapshot = snapshot
+        logger.info("Loaded %d torrent data from snapshot %s", len(snapshot), path)
+        return len(snapshot)
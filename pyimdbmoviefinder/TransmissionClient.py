@@ -0,0 +1,199 @@
+'''
+Module implementing a client for the transmission daemon RPC protocol.
+A persistent HTTP session is kept, along with the transmission session id, so successive
+calls only cost one request each.
+'''
+from typing import List
+import asyncio
+import logging
+import threading
+import requests
+from pyimdbmoviefinder.CacheBackend import CacheBackend
+
+logger = logging.getLogger('pyimdbmoviefinder')
+SESSION_HEADER = 'X-Transmission-Session-Id'
+SESSION_TTL = 60 * 60
+DEFAULT_STATUS_FIELDS = ('id', 'hashString', 'name', 'status', 'percentDone', 'rateDownload',
+                         'eta', 'error', 'errorString')
+
+
+class TransmissionError(Exception):
+    """Raised when the transmission daemon can not be reached or rejects a call
+    """
+
+
+class TransmissionClient:
+    """Synchronous transmission RPC client
+    """
+
+    def __init__(self, host: str, user: str = None, pw: str = None, timeout: float = 30,
+                 cache: CacheBackend = None):
+        #pylint: disable=too-many-arguments
+        """Constructor
+
+        Args:
+            host (str): RPC url, ie. http://localhost:9091/transmission/rpc
+            user (str, optional): RPC user name. Defaults to None.
+            pw (str, optional): RPC password. Defaults to None.
+            timeout (float, optional): Request timeout in seconds. Defaults to 30.
+            cache (CacheBackend, optional): Cache sharing the session id with other processes,
+                saving them the session negotiation. Defaults to None.
+        """
+        self.host = host
+        self.timeout = timeout
+        self.session = requests.Session()
+        if user:
+            self.session.auth = (user, pw or '')
+        self.cache = cache
+        self.sessionId = cache.get(f"transmission:session:{host}") if cache else None
+        self.tag = 0
+        self.lock = threading.Lock()
+
+    def call(self, method: str, arguments: dict = None) -> dict:
+        """Call a RPC method, negotiating the session id if needed
+
+        Args:
+            method (str): RPC method, ie. torrent-get
+            arguments (dict, optional): Method arguments. Defaults to None.
+
+        Raises:
+            TransmissionError: If the daemon is unreachable or the call failed
+
+        Returns:
+            dict: The arguments of the response
+        """
+        # The lock only guards the session id and tag, requests run concurrently
+        with self.lock:
+            self.tag += 1
+            body = {'method': method, 'arguments': arguments or {}, 'tag': self.tag}
+            sessionId = self.sessionId
+        for _ in range(2):
+            headers = {SESSION_HEADER: sessionId} if sessionId else {}
+            try:
+                resp = self.session.post(self.host, json=body, headers=headers,
+                                         timeout=self.timeout)
+            except requests.RequestException as e:
+                raise TransmissionError(
+                    f"Unable to send the request, verify your config : {e}") from e
+            if resp.status_code == 409 and SESSION_HEADER in resp.headers:
+                # Session id expired or not negotiated yet, retry with the new one
+                sessionId = resp.headers[SESSION_HEADER]
+                with self.lock:
+                    changed = self.sessionId != sessionId
+                    self.sessionId = sessionId
+                if changed and self.cache is not None:
+                    self.cache.set(f"transmission:session:{self.host}", sessionId,
+                                   SESSION_TTL)
+                continue
+            break
+        if resp.status_code == 401:
+            raise TransmissionError("Unauthorized, check your user/password")
+        if resp.status_code != 200:
+            raise TransmissionError(f"Server answered HTTP {resp.status_code}, check your "
+                                    "hostname or webserver configuration !")
+        try:
+            data = resp.json()
+        except ValueError as e:
+            raise TransmissionError("Server answer is not a RPC response") from e
+        if data.get('result') != 'success':
+            raise TransmissionError(f"{method} failed: {data.get('result')}")
+        return data.get('arguments', {})
+
+    def torrent_add(self, magnetLink: str, downloadDir: str = None) -> dict:
+        """Add a torrent from a magnet link or torrent url
+
+        Args:
+            magnetLink (str): The magnet link or url of the torrent
+            downloadDir (str, optional): Download directory. Defaults to the daemon setting.
+
+        Raises:
+            TransmissionError: If the torrent could not be added
+
+        Returns:
+            dict: id, hashString and name of the torrent, plus duplicate set to True if the
+                torrent was already known by the daemon
+        """
+        args = {'filename': magnetLink}
+        if downloadDir:
+            args['download-dir'] = downloadDir
+        result = self.call('torrent-add', args)
+        if 'torrent-duplicate' in result:
+            return dict(result['torrent-duplicate'], duplicate=True)
+        return dict(result.get('torrent-added', {}), duplicate=False)
+
+    def torrent_get(self, fields=DEFAULT_STATUS_FIELDS, ids=None) -> List[dict]:
+        """Get the status of many torrents in a single call
+
+        Args:
+            fields (Iterable[str], optional): Torrent fields wanted. Defaults to the main
+                status fields.
+            ids (List, optional): Torrent ids or hash strings. Defaults to all torrents.
+
+        Raises:
+            TransmissionError: If the call failed
+
+        Returns:
+            List[dict]: One dict of the requested fields per torrent
+        """
+        args = {'fields': list(fields)}
+        if ids is not None:
+            args['ids'] = list(ids)
+        return self.call('torrent-get', args).get('torrents', [])
+
+    def close(self):
+        """Close the HTTP session
+        """
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exception, value, tb):
+        self.close()
+
+
+class AsyncTransmissionClient:
+    """Asyncio transmission RPC client, sharing one persistent session between calls.
+    Calls run in the default executor so they do not block the event loop.
+    """
+
+    def __init__(self, host: str, user: str = None, pw: str = None, timeout: float = 30,
+                 cache: CacheBackend = None):
+        #pylint: disable=too-many-arguments
+        """Constructor
+
+        Args:
+            host (str): RPC url, ie. http://localhost:9091/transmission/rpc
+            user (str, optional): RPC user name. Defaults to None.
+            pw (str, optional): RPC password. Defaults to None.
+            timeout (float, optional): Request timeout in seconds. Defaults to 30.
+            cache (CacheBackend, optional): Cache sharing the session id with other processes,
+                saving them the session negotiation. Defaults to None.
+        """
+        self.client = TransmissionClient(host, user, pw, timeout, cache)
+
+    async def call(self, method: str, arguments: dict = None) -> dict:
+        """See TransmissionClient.call
+        """
+        return await asyncio.to_thread(self.client.call, method, arguments)
+
+    async def torrent_add(self, magnetLink: str, downloadDir: str = None) -> dict:
+        """See TransmissionClient.torrent_add
+        """
+        return await asyncio.to_thread(self.client.torrent_add, magnetLink, downloadDir)
+
+    async def torrent_get(self, fields=DEFAULT_STATUS_FIELDS, ids=None) -> List[dict]:
+        """See TransmissionClient.torrent_get
+        """
+        return await asyncio.to_thread(self.client.torrent_get, fields, ids)
+
+    async def close(self):
+        """Close the HTTP session
+        """
+        self.client.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exception, value, tb):
+        await self.close()
@@ -0,0 +1,232 @@
+'''
+Module used to monitor a list of movies for new or better torrents.
+Each watched movie remembers the torrents already seen (by info hash) and the HTTP validators
+of every provider feed, so a poll only parses feeds that changed and only reports torrents that
+were not seen before.
+'''
+from typing import Dict, List
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import logging
+import random
+import re
+import threading
+import time
+# Fetcher modules register themselves in the fetcher registry when imported
+import pyimdbmoviefinder.YtsFetcher #pylint: disable=unused-import
+import pyimdbmoviefinder.JackettFetcher #pylint: disable=unused-import
+from pyimdbmoviefinder.TorrentFetcher import TorrentResult, SearchQuery, select_fetchers
+
+logger = logging.getLogger('pyimdbmoviefinder')
+RESOLUTION_REGEX = re.compile(r'(2160|1080|720|480)p')
+DEFAULT_INTERVAL = 6 * 3600
+
+
+def resolution_rank(torrent: TorrentResult) -> int:
+    """Find the vertical resolution of a torrent from its quality or name
+
+    Args:
+        torrent (TorrentResult): The torrent
+
+    Returns:
+        int: The resolution (ie. 1080), 0 if unknown
+    """
+    found = RESOLUTION_REGEX.findall(f'{torrent.quality} {torrent.name}')
+    return max((int(res) for res in found), default=0)
+
+
+@dataclass
+class WatchEntry():
+    """Dataclass holding the state of a watched movie
+    """
+    imdbId: str
+    title: str
+    # Info hash (or url when unknown) -> resolution of every torrent already reported
+    seen: Dict[str, int] = field(default_factory=dict)
+    # Provider name -> HTTP validators of its last feed
+    validators: Dict[str, dict] = field(default_factory=dict)
+    nextPoll: float = 0.0
+
+    def best_resolution(self) -> int:
+        """Best resolution seen so far
+
+        Returns:
+            int: The resolution, 0 if nothing was seen
+        """
+        return max(self.seen.values(), default=0)
+
+
+@dataclass
+class WatchEvent():
+    """Dataclass describing a torrent reported by the watchlist monitor
+    """
+    imdbId: str
+    torrent: TorrentResult
+    upgrade: bool = False
+
+
+class WatchlistMonitor:
+    """Class polling torrent providers for the movies of a watchlist
+    """
+
+    def __init__(self, interval: float = DEFAULT_INTERVAL, jitter: float = 0.1,
+                 jackettApiKey: str = None, jackettHost: str = None, maxWorkers: int = 4):
+        #pylint: disable=too-many-arguments
+        """Constructor
+
+        Args:
+            interval (float, optional): Seconds between two polls of a movie. Defaults to 6h.
+            jitter (float, optional): Random spread of the interval, as a ratio. Defaults to 0.1.
+            jackettApiKey (str, optional): Jackett API key, Jackett is not polled if None.
+            jackettHost (str, optional): Jackett Host. Defaults to None.
+            maxWorkers (int, optional): Max movies polled concurrently. Defaults to 4.
+        """
+        self.interval = interval
+        self.jitter = jitter
+        self.jackettApiKey = jackettApiKey
+        self.jackettHost = jackettHost
+        self.maxWorkers = maxWorkers
+        self.entries: Dict[str, WatchEntry] = {}
+        self.lock = threading.Lock()
+
+    def add(self, imdbId: str, title: str) -> WatchEntry:
+        """Start watching a movie. The first poll is spread over the jitter window so a large
+        watchlist does not hit the providers all at once.
+
+        Args:
+            imdbId (str): IMDb ID
+            title (str): Movie title, used by Jackett
+
+        Returns:
+            WatchEntry: The watch entry
+        """
+        with self.lock:
+            entry = self.entries.get(imdbId)
+            if entry is None:
+                entry = WatchEntry(imdbId, title, nextPoll=time.monotonic() +
+                                   random.uniform(0, self.interval * self.jitter))
+                self.entries[imdbId] = entry
+            return entry
+
+    def remove(self, imdbId: str):
+        """Stop watching a movie
+
+        Args:
+            imdbId (str): IMDb ID
+        """
+        with self.lock:
+            self.entries.pop(imdbId, None)
+
+    def next_delay(self) -> float:
+        """Compute the delay before the next poll, jittered around the interval
+
+        Returns:
+            float: Delay in seconds
+        """
+        return self.interval * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def build_fetchers(self, entry: WatchEntry):
+        """Build the fetchers for a watched movie, wired to the entry validators
+
+        Args:
+            entry (WatchEntry): The watch entry
+
+        Returns:
+            List: List of (provider name, fetcher)
+        """
+        query = SearchQuery(entry.imdbId, entry.title,
+                            options={'jackettApiKey': self.jackettApiKey,
+                                     'jackettHost': self.jackettHost})
+        fetchers = []
+        for info in select_fetchers(query):
+            try:
+                fetcher = info.fetcherClass.from_query(query)
+            except ValueError:
+                # Provider not configured
+                continue
+            fetcher.validators = entry.validators.setdefault(info.name, {})
+            fetchers.append((info.name, fetcher))
+        return fetchers
+
+    def poll_entry(self, entry: WatchEntry) -> List[WatchEvent]:
+        """Poll all providers for one movie and report the torrents not seen before
+
+        Args:
+            entry (WatchEntry): The watch entry
+
+        Returns:
+            List: List of WatchEvent
+        """
+        events = []
+        for name, fetcher in self.build_fetchers(entry):
+            try:
+                res, output = fetcher.fetch()
+            except Exception as e: #pylint: disable=broad-exception-caught
+                logger.warning("Polling %s for %s failed: %s", name, entry.imdbId, e)
+                # Force a full fetch next time
+                entry.validators.pop(name, None)
+                continue
+            if fetcher.unchanged or not res or not output:
+                continue
+            events += self.diff(entry, output)
+        entry.nextPoll = time.monotonic() + self.next_delay()
+        return events
+
+    def diff(self, entry: WatchEntry, torrents: List[TorrentResult]) -> List[WatchEvent]:
+        """Record torrents in the entry and report the new ones. A new torrent is an upgrade
+        when its resolution is better than anything seen before.
+
+        Args:
+            entry (WatchEntry): The watch entry
+            torrents (List[TorrentResult]): Torrents currently offered by a provider
+
+        Returns:
+            List: List of WatchEvent
+        """
+        events = []
+        best = entry.best_resolution()
+        for torrent in torrents:
+            key = torrent.infoHash or torrent.url
+            if not key or key in entry.seen:
+                continue
+            rank = resolution_rank(torrent)
+            entry.seen[key] = rank
+            events.append(WatchEvent(entry.imdbId, torrent, upgrade=0 < best < rank))
+        return events
+
+    def poll_due(self, now: float = None) -> List[WatchEvent]:
+        """Poll every movie whose next poll time has passed
+
+        Args:
+            now (float, optional): time.monotonic() reference. Defaults to now.
+
+        Returns:
+            List: List of WatchEvent
+        """
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            due = [entry for entry in self.entries.values() if entry.nextPoll <= now]
+        if not due:
+            return []
+        logger.info("Polling %d watched movies", len(due))
+        events = []
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            for result in executor.map(self.poll_entry, due):
+                events += result
+        return events
+
+    def run(self, callback, stopEvent: threading.Event):
+        """Poll the watchlist until stopEvent is set
+
+        Args:
+            callback (callable): Called with the list of WatchEvent after each poll round
+            stopEvent (threading.Event): Event stopping the monitor
+        """
+        while not stopEvent.is_set():
+            events = self.poll_due()
+            if events:
+                callback(events)
+            with self.lock:
+                nextPoll = min((entry.nextPoll for entry in self.entries.values()),
+                               default=time.monotonic() + self.interval)
+            stopEvent.wait(max(1.0, nextPoll - time.monotonic()))
@@ -2,59 +2,157 @@
 Module used to search for torrent on YTS.
 Results are then stored in TorrentResult object for further processing
 '''
-from typing import List
+from typing import List, NamedTuple
+import json
 import logging
+import time
 import requests
-from requests.adapters import HTTPAdapter
-from urllib3.util import Retry
-from pyimdbmoviefinder.TorrentFetcher import TorrentFetcher, TorrentResult
+from pyimdbmoviefinder.http_utils import conditional_headers, update_validators
+from pyimdbmoviefinder.RateLimiter import get_rate_limiter
+from pyimdbmoviefinder.MemoryProfiler import profiled
+from pyimdbmoviefinder.TorrentFetcher import TorrentFetcher, TorrentResult, SearchQuery, \
+    FilterSpec, register_fetcher
 
 logger = logging.getLogger('pyimdbmoviefinder')
+# Keys kept while decoding a YTS list_movies payload, everything else is dropped by the decoder
+YTS_FIELDS = frozenset(('data', 'movies', 'title_long', 'torrents', 'quality', 'type',
+                        'seeds', 'size', 'size_bytes', 'url', 'hash'))
 
 
+class YtsRecord(NamedTuple):
+    """Compact record holding the fields of a YTS torrent we make use of
+    """
+    title: str
+    quality: str
+    type: str
+    seeds: int
+    size: str
+    sizeBytes: int
+    url: str
+    hash: str
+
+
+def _select_fields(pairs):
+    return {key: value for key, value in pairs if key in YTS_FIELDS}
+
+
+@profiled("parse.YTS")
+def decode_yts_payload(raw: bytes, filterSpec: FilterSpec = None):
+    """Decode a YTS list_movies response, keeping only the fields needed for torrent results.
+    Objects are pruned while being decoded, so the unused movie metadata (descriptions,
+    images, genres...) is never built into dicts.
+
+    Args:
+        raw (bytes): The raw response body
+        filterSpec (FilterSpec, optional): Filter torrents must pass, checked before building
+            records on the quality and type fields, never on the movie title.
+            Defaults to None (keep all torrents).
+
+    Returns:
+        List[YtsRecord] | None: Torrents of all movies in the payload, None if no movie matched
+    """
+    payload = json.loads(raw, object_pairs_hook=_select_fields)
+    movies = (payload.get('data') or {}).get('movies')
+    if movies is None:
+        return None
+    records = []
+    for movie in movies:
+        title_long = movie.get('title_long')
+        logger.info("Found torrents on YTS for : %s", title_long)
+        torrents = movie.get('torrents')
+        if torrents is None:
+            logger.info("no torrent for this movie")
+            continue
+        if filterSpec is not None:
+            torrents = [torrent for torrent in torrents
+                        if filterSpec.accepts(title_long, torrent.get('seeds') or 0,
+                                              torrent.get('size_bytes') or 0,
+                                              torrent.get('quality') or '',
+                                              torrent.get('type') or '')]
+        records += [YtsRecord(title_long,
+                              torrent.get('quality'),
+                              torrent.get('type'),
+                              torrent.get('seeds'),
+                              torrent.get('size'),
+                              torrent.get('size_bytes'),
+                              torrent.get('url'),
+                              torrent.get('hash'))
+                    for torrent in torrents]
+    return records
+
+
+@register_fetcher("YTS", latency=0.5, cost=1.0, searchByImdbId=True, supportsTv=False)
 class YtsFetcher(TorrentFetcher):
     """
     Class for scraping YTS torrents
     """
-    def __init__(self, imdbId):
+    def __init__(self, imdbId, filterSpec: FilterSpec = None):
         """Constructor
         Args:
             imdbId (str): The IMDb ID of the Movie/TV
+            filterSpec (FilterSpec, optional): Filter torrents must pass.
+                Defaults to None (keep all torrents).
         """
         self.url = "https://yts.mx/api/v2/list_movies.json?query_term="
         self.movieId = "tt"+imdbId
+        self.filterSpec = filterSpec
+
+    @classmethod
+    def from_query(cls, query: SearchQuery):
+        """Build the fetcher for a search query
+
+        Args:
+            query (SearchQuery): The search query
 
-    def requests_retry_session(
+        Returns:
+            YtsFetcher: The fetcher
+        """
+        return cls(query.imdbId, query.filterSpec)
+
+    def requests_retry_get(
         self,
+        url: str,
+        headers: dict = None,
         retries=3,
         backoffFactor=0.3,
         statusForcelist=(500, 502, 504),
-        session=None,
-    ):
-        """Wrapper for HTTP retry
+    ) -> requests.Response:
+        """GET with HTTP retry. Every attempt waits for the rate limiter of the host, so
+        retries count against the host budget, and the back off sleep is spent outside
+        of the limiter slot.
 
         Args:
+            url (str): The requested url
+            headers (dict, optional): Request headers. Defaults to None.
             retries (int, optional): number of retries. Defaults to 3.
             backoffFactor (float, optional): Back Off factor. Defaults to 0.3.
             statusForcelist (tuple, optional): Force retry code list. Defaults to (500, 502, 504).
-            session (_type_, optional): Request session if any. Defaults to None.
+
+        Raises:
+            requests.RequestException: If the last attempt failed to reach the server
 
         Returns:
-            Session: The session
+            Response: The response of the last attempt
         """
-        session = session or requests.Session()
-        retry = Retry(
-            total=retries,
-            read=retries,
-            connect=retries,
-            backoff_factor=backoffFactor,
-            status_forcelist=statusForcelist,
-        )
-        adapter = HTTPAdapter(max_retries=retry)
-        session.mount('http://', adapter)
-        session.mount('https://', adapter)
-        return session
+        limiter = get_rate_limiter()
+        with requests.Session() as session:
+            for attempt in range(retries + 1):
+                if attempt:
+                    time.sleep(backoffFactor * 2 ** (attempt - 1))
+                try:
+                    with limiter.limit(url):
+                        response = session.get(url, timeout=120, headers=headers)
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    if attempt == retries:
+                        raise
+                    logger.debug("YTS request failed (%s), retrying %s", e, url)
+                    continue
+                if response.status_code not in statusForcelist or attempt == retries:
+                    return response
+                logger.debug("YTS answered HTTP %d, retrying %s", response.status_code, url)
+        return response
 
+    @profiled("fetch.YTS")
     def fetch(self) -> tuple[bool, List[TorrentResult]]:
         """Run the fetcher with provided arguments
 
@@ -62,28 +160,35 @@ class YtsFetcher(TorrentFetcher):
             tuple[bool, List[TorrentResult]]: List of torrents found
         """
         api_url = self.url + self.movieId
-        response = self.requests_retry_session().get(api_url, timeout=120).json()
-        logger.debug(response)
-        data = response.get('data')
-        movies = data.get('movies')
-        if movies is None:
-            return False, "Torrents not found on YTS"
-        for movie in movies:
-            title_long = movie.get('title_long')
-            logger.info("Found torrents on YTS for : %s", title_long)
-            torrents = movie.get('torrents')
-            if torrents is None:
-                logger.info("no torrent for this movie")
-                continue
-            descs = []
-            for torrent in torrents:
-                logger.debug(torrent)
-                desc = TorrentResult(title_long,
-                                     torrent.get('quality'),
-                                     torrent.get('type'),
-                                     torrent.get('seeds'),
-                                     torrent.get('size'),
-                                     "YTS",
-                                     torrent.get('url'))
-                descs.append(desc)
+        headers = conditional_headers(self.validators) if self.validators is not None else None
+        httpResponse = self.requests_retry_get(api_url, headers)
+        if self.validators is not None and httpResponse.status_code == 304:
+            logger.debug("YTS response not modified for %s", self.movieId)
+            self.unchanged = True
+            return True, None
+        if httpResponse.status_code != 200:
+            return False, f"YTS answered HTTP {httpResponse.status_code}"
+        records = decode_yts_payload(httpResponse.content, self.filterSpec)
+        if self.validators is not None:
+            # The payload embeds server timestamps and seeder counts changing at every call,
+            # so only the fields telling torrents apart (what watchers report) are compared
+            fingerprint = json.dumps([(record.hash, record.quality)
+                                      for record in records or ()]).encode()
+            if not update_validators(self.validators, httpResponse.headers, fingerprint):
+                logger.debug("YTS torrents unchanged for %s", self.movieId)
+                self.unchanged = True
+                return True, None
+        if records is None or (not records and self.filterSpec is None):
+            return None, "Torrents not found on YTS"
+        logger.debug("YTS returned %d torrents for %s", len(records), self.movieId)
+        descs = [TorrentResult(record.title,
+                               record.quality,
+                               record.type,
+                               record.seeds,
+                               record.size,
+                               "YTS",
+                               record.url,
+                               infoHash=record.hash or '',
+                               sizeBytes=record.sizeBytes or 0)
+                 for record in records]
         return True, descs
@@ -6,16 +6,16 @@ import logging
 from sys import path
 from os.path import dirname
 from colorama import init as cinit
-from pyimdbmoviefinder.utils import LoggingColorFilter
+from pyimdbmoviefinder.utils import ColorFormatter, is_tty
 path.append(dirname(__file__))
 
 cinit()
 ch = logging.StreamHandler()
-formatter = logging.Formatter(
-    '%(asctime)s %(levelname)8s %(filename)s | %(message)s')
+LOG_FORMAT = '%(asctime)s %(levelname)8s %(filename)s | %(message)s'
+# Only color output going to a terminal
+formatter = ColorFormatter(LOG_FORMAT) if is_tty(ch.stream) else logging.Formatter(LOG_FORMAT)
 ch.setFormatter(formatter)
 
 logger = logging.getLogger('pyimdbmoviefinder')
 logger.addHandler(ch)
 logger.setLevel(logging.INFO)  # Change this for more logging
-logger.addFilter(LoggingColorFilter())
@@ -9,7 +9,11 @@ import sys
 from getpass import getpass
 from pyimdbmoviefinder.ImdbSearcher import ImdbSearcher
 from pyimdbmoviefinder.TorrentSearcher import TorrentSearcher
+from pyimdbmoviefinder.TorrentPrefetcher import TorrentPrefetcher
 from pyimdbmoviefinder.TorrentDownloader import TorrentDownloader
+from pyimdbmoviefinder.RateLimiter import get_rate_limiter
+from pyimdbmoviefinder.CacheBackend import cache_from_config
+from pyimdbmoviefinder.MemoryProfiler import get_memory_profiler
 from pyimdbmoviefinder.utils import Spinner
 
 DEFAULT_MAX_RESULT = 8
@@ -98,10 +102,16 @@ def cli():
         action="store_true")
     parser.add_argument("-n", "--num", help="Maximum number of search results")
     parser.add_argument("--tv", help="Include TV shows in search", action="store_true")
+    parser.add_argument("-p", "--prefetch", type=int, default=0,
+                        help="Search torrents of the first N results while choosing")
+    parser.add_argument("--memprofile", metavar="REPORT",
+                        help="Profile memory usage and write a JSON report")
     if len(sys.argv) == 0:
         parser.print_help()
         parser.exit()
     args = vars(parser.parse_args())
+    if args["memprofile"]:
+        get_memory_profiler().enable(args["memprofile"])
 
     maxResult = args["num"] if args["num"] else DEFAULT_MAX_RESULT
     searchAll = args["all"]
@@ -111,6 +121,8 @@ def cli():
     config = configparser.ConfigParser()
     config_path = str(pathlib.Path(__file__).parent) + "/config.ini"
     config.read(config_path)
+    get_rate_limiter().load_config(config)
+    cache = cache_from_config(config)
     try:
         jackettHost = config.get("Jackett", "Host")
         jackettApiKey = config.get("Jackett", "ApiKey")
@@ -118,39 +130,50 @@ def cli():
         jackettHost = jackettApiKey = None
 
     # 1. Search IMDb
+    imdbSearcher = ImdbSearcher(cache=cache)
     with Spinner():
         if args["title"]:
-            imdbResult = ImdbSearcher().search_by_title(
+            imdbResult = imdbSearcher.search_by_title(
                 args['title'], maxResult, includeTv=includeTv)
         elif args["id"]:
-            imdbResult = ImdbSearcher().search_by_title(args['id'])
+            imdbResult = imdbSearcher.search_by_title(args['id'])
         else:
             parser.print_help()
             parser.exit()
 
+    searcher = TorrentSearcher(resultCache=cache)
+    prefetcher = TorrentPrefetcher(searcher, {'yts': True, 'jackett': searchAll,
+                                              'jackettApiKey': jackettApiKey,
+                                              'jackettHost': jackettHost})
     if imdbResult is None:
         logger.warning("No IMDb results")
         sys.exit(0)
     else:
+        if args["prefetch"] > 0:
+            prefetcher.prefetch(imdbResult, args["prefetch"])
         choice = show_imdb(imdbResult)
 
     torrent_errors = []
     # Search torrents
     with Spinner():
-        searcher = TorrentSearcher()
-        res, error = searcher.set_search(choice.imdbId, choice.title, yts=True,
-                                        jackett=searchAll,  jackettApiKey=jackettApiKey,
-                                        jackettHost=jackettHost)
-        if not res:
-            torrent_errors.append(error)
-        torrentResult, errors = searcher.run()
+        prefetched = prefetcher.result(choice.imdbId)
+        prefetcher.cancel()
+        if prefetched:
+            torrentResult, errors = prefetched
+        else:
+            res, error = searcher.set_search(choice.imdbId, choice.title, yts=True,
+                                            jackett=searchAll,  jackettApiKey=jackettApiKey,
+                                            jackettHost=jackettHost, isTv=choice.is_tv())
+            if not res:
+                torrent_errors.append(error)
+            torrentResult, errors = searcher.run()
 
     if errors:
         torrent_errors.append(errors)
     if torrent_errors:
         for err in torrent_errors:
             logger.error(err)
-    if torrentResult is None:
+    if torrentResult is None or not torrentResult.torrents:
         logger.warning("No Torrents found")
         sys.exit(0)
     else:
@@ -170,7 +193,7 @@ def cli():
         rpc_password = getpass()
 
     # Send to server
-    dl = TorrentDownloader(rpc_host, rpc_user, rpc_password)
+    dl = TorrentDownloader(rpc_host, rpc_user, rpc_password, cache=cache)
     result, info = dl.add_torrent_magnet(choice.url)
     if result:
         logger.info(info)
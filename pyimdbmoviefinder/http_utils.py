@@ -1,10 +1,12 @@
 '''
 Utility module for HTTP requests
 '''
+import hashlib
 import logging
 
 from urllib import parse, request
-from urllib.error import URLError
+from urllib.error import HTTPError, URLError
+from pyimdbmoviefinder.RateLimiter import get_rate_limiter
 
 logger = logging.getLogger('pyimdbmoviefinder')
 
@@ -50,8 +52,72 @@ def fetch_url(url):
     req = request.Request(url, headers={'User-Agent': 'Mozilla/5.0'})
 
     try:
-        with request.urlopen(req, timeout=60) as response:
+        with get_rate_limiter().limit(url), request.urlopen(req, timeout=60) as response:
             return True, response.read()
     except URLError as e:
         e = ('We failed to reach a server with request: %s\n', str(e))
         return False, e
+
+
+def conditional_headers(validators: dict) -> dict:
+    """
+    Build the conditional request headers from the validators of a previous response
+    :param dict validators: validators stored by update_validators
+    :return: the If-None-Match / If-Modified-Since headers
+    :rtype: dict
+    """
+    headers = {}
+    if validators.get('etag'):
+        headers['If-None-Match'] = validators['etag']
+    if validators.get('lastModified'):
+        headers['If-Modified-Since'] = validators['lastModified']
+    return headers
+
+
+def update_validators(validators: dict, headers, body: bytes) -> bool:
+    """
+    Store the validators of a response and tell if its body changed since the previous one
+    :param dict validators: validators of the previous response, updated in place
+    :param headers: the response headers (mapping)
+    :param bytes body: the response body, or only the part of it worth comparing when the
+        body holds volatile data (ie. server timestamps)
+    :return: True if the body differs from the previous response
+    :rtype: bool
+    """
+    digest = hashlib.sha1(body).hexdigest()
+    changed = validators.get('digest') != digest
+    validators['digest'] = digest
+    validators['etag'] = headers.get('ETag')
+    validators['lastModified'] = headers.get('Last-Modified')
+    return changed
+
+
+def fetch_url_conditional(url, validators: dict):
+    """
+    Call a given url with conditional headers and skip unchanged responses
+    :param str url: the url we want to make a request to
+    :param dict validators: validators of the previous response, updated in place
+    :return: the response content, or None if it did not change since the previous call
+    :rtype: bool, bytes
+    """
+    logger.debug('Fetching conditional query: %s', url)
+    headers = {'User-Agent': 'Mozilla/5.0'}
+    headers.update(conditional_headers(validators))
+    req = request.Request(url, headers=headers)
+
+    try:
+        with get_rate_limiter().limit(url), request.urlopen(req, timeout=60) as response:
+            body = response.read()
+            if not update_validators(validators, response.headers, body):
+                logger.debug('Response unchanged: %s', url)
+                return True, None
+            return True, body
+    except HTTPError as e:
+        if e.code == 304:
+            logger.debug('Not modified: %s', url)
+            return True, None
+        e = ('We failed to reach a server with request: %s\n', str(e))
+        return False, e
+    except URLError as e:
+        e = ('We failed to reach a server with request: %s\n', str(e))
+        return False, e
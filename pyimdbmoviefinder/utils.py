@@ -23,17 +23,21 @@ class BColors:
     UNDERLINE = '\033[4m'
 
 
+COLOR_BY_LEVEL = {
+    logging.DEBUG: BColors.OKCYAN,
+    logging.WARNING: BColors.WARNING,
+    logging.ERROR: BColors.FAIL,
+    logging.INFO: BColors.OKBLUE
+}
+
+
 class LoggingColorFilter(logging.Filter):
     """
-    Class for setting specific colors to logging
+    Class for setting specific colors to logging.
+    Mutates every record, even the ones never printed to a terminal, prefer ColorFormatter.
     """
 
-    color_by_level = {
-        logging.DEBUG: BColors.OKCYAN,
-        logging.WARNING: BColors.WARNING,
-        logging.ERROR: BColors.FAIL,
-        logging.INFO: BColors.OKBLUE
-    }
+    color_by_level = COLOR_BY_LEVEL
 
     def filter(self, record):
         record.raw_msg = record.msg
@@ -43,6 +47,81 @@ class LoggingColorFilter(logging.Filter):
         return True
 
 
+class ColorFormatter(logging.Formatter):
+    """
+    Formatter coloring the log lines by level, to be set only on handlers writing to a TTY
+    """
+
+    def format(self, record):
+        line = super().format(record)
+        color = COLOR_BY_LEVEL.get(record.levelno)
+        if color:
+            return f'{color}{line}{BColors.ENDC}'
+        return line
+
+
+def is_tty(stream) -> bool:
+    """Tell if a stream is an interactive terminal
+
+    Args:
+        stream: The stream
+
+    Returns:
+        bool: True if the stream is a TTY
+    """
+    try:
+        return stream.isatty()
+    except (AttributeError, ValueError):
+        return False
+
+
+class LogSampler:
+    """
+    Rate limits repetitive log messages, ie. per item messages of a large feed:
+    a message key is logged for its first occurrences, then once every `every` occurrences.
+    """
+
+    def __init__(self, first: int = 5, every: int = 100):
+        """Constructor
+
+        Args:
+            first (int, optional): Occurrences always logged. Defaults to 5.
+            every (int, optional): Sampling period after the first occurrences. Defaults to 100.
+        """
+        self.first = first
+        self.every = every
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def sample(self, key: str) -> bool:
+        """Count an occurrence of a message and tell if it should be logged
+
+        Args:
+            key (str): Message key
+
+        Returns:
+            bool: True if this occurrence should be logged
+        """
+        with self.lock:
+            count = self.counts.get(key, 0) + 1
+            self.counts[key] = count
+        return count <= self.first or count % self.every == 0
+
+    def log(self, logger: logging.Logger, level: int, key: str, msg: str, *args):
+        #pylint: disable=too-many-arguments
+        """Log a message if the level is enabled and the occurrence is sampled
+
+        Args:
+            logger (logging.Logger): The logger
+            level (int): Log level
+            key (str): Message key
+            msg (str): Message format
+            args: Message arguments
+        """
+        if logger.isEnabledFor(level) and self.sample(key):
+            logger.log(level, msg, *args, stacklevel=2)
+
+
 class Spinner:
     """Spinner class for showing a loading spinner in the command line
     """